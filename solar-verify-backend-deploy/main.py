@@ -1,88 +1,375 @@
 import os
-import random
+import atexit
+import re
+import math
+import bisect
 import string
+import time
+import queue
+import threading
+import decimal
+import hmac
+import html
+import secrets
+import hashlib
 import jwt
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
+import orjson
+from datetime import datetime
+from collections import namedtuple
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 # Resend email helper (replaces SendGrid)
-from resend_email import send_email, send_email_with_attachment, send_email_with_resend
+from resend_email import RESEND_API_KEY, RESEND_BATCH_MAX, send_email, send_email_with_attachment, send_batch_emails
 import base64
 import stripe
 from premium_pdf_generator import send_premium_report_email
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from cachetools import TTLCache
+import redis
+
+def _orjson_default(obj):
+    """Serialize the types Flask's default provider handles but orjson doesn't"""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for faster jsonify/get_json"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # jsonify() path: hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype='application/json')
 
 app = Flask(__name__)
-CORS(app, 
-     resources={r"/*": {
-         "origins": ["https://solarverify.co.uk", "http://localhost:5173"],
-         "methods": ["GET", "POST", "OPTIONS"],
-         "allow_headers": ["Content-Type", "Authorization"],
-         "supports_credentials": True,
-         "max_age": 3600
-     }} )
+app.json = ORJSONProvider(app)
 @app.before_request
 def handle_preflight():
     if request.method == "OPTIONS":
         response = app.make_default_options_response()
         return response
 
+def error_response(prefix, exc, code=500):
+    """JSON error body for an exception caught in a route handler"""
+    return jsonify({'error': f'{prefix}: {exc}'}), code
+
 
 
 
 # Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'https://solarverify.co.uk')
+JWT_SECRET_BYTES = JWT_SECRET.encode()
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_51SUEW63AjmmTakKd7gU5IkTmTJMHNDMN2DBYqElcFmXmOprtQ22xWExu8XPDFSLx4ds5W0PbSV1ddF0u3lngiWto00U42uLG9J')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY', 'pk_test_51SUEW63AjmmTakKdTq4V8iPXsIQ2lHYIl5rGshAMlvwSqhJRJe3PFjyUgsLQOGlOLMzSsEwNHlKI3CdQq8OuQNUC00sDNBFKKx')
 
+# CORS is limited to the configured frontend plus the local Vite dev server
+CORS_ORIGINS = [FRONTEND_URL, "http://localhost:5173"]
+CORS(app, 
+     resources={r"/*": {
+         "origins": CORS_ORIGINS,
+         "methods": ["GET", "POST", "OPTIONS"],
+         "allow_headers": ["Content-Type", "Authorization"],
+         "supports_credentials": True,
+         "max_age": 3600
+     }} )
+
 # Initialize Stripe
 stripe.api_key = STRIPE_SECRET_KEY
+# Pin one requests-backed client so connections to api.stripe.com stay pooled
+# (keep-alive) across checkout and payment verification calls
+stripe.default_http_client = stripe.http_client.RequestsClient()
 
-# Database connection helper
-def get_db_connection():
-    """Get database connection from Railway Postgres"""
+# Request-invariant parts of the premium checkout session
+PREMIUM_LINE_ITEMS = [{
+    'price_data': {
+        'currency': 'gbp',
+        'unit_amount': 4499,  # £44.99 in pence
+        'product_data': {
+            'name': 'Premium Solar Quote Analysis',
+            'description': 'Detailed analysis with panel brand assessment, inverter quality check, battery evaluation, and personalized recommendations',
+            'images': ['https://solarverify.co.uk/logo.png'],
+        },
+    },
+    'quantity': 1,
+}]
+PREMIUM_SUCCESS_URL = f'{FRONTEND_URL}/premium-success?session_id={{CHECKOUT_SESSION_ID}}'
+PREMIUM_CANCEL_URL = f'{FRONTEND_URL}/analyzer?upgrade=cancelled'
+PREMIUM_METADATA = {'product': 'premium_analysis'}
+
+# Database connection pool, created on first use so startup works without a database
+DB_POOL_MIN_CONN = 2
+DB_POOL_MAX_CONN = 20
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Get the Railway Postgres connection pool, or None if DATABASE_URL isn't set"""
+    global _db_pool
     database_url = os.environ.get('DATABASE_URL')
-    if database_url:
-        return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    if not database_url:
+        return None
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ThreadedConnectionPool(DB_POOL_MIN_CONN, DB_POOL_MAX_CONN, database_url, cursor_factory=RealDictCursor)
+    return _db_pool
+
+# Database connection helpers
+def get_db_connection():
+    """Borrow a database connection from the pool; hand it back with release_db_connection"""
+    pool = get_db_pool()
+    if pool:
+        return pool.getconn()
     return None
 
+def release_db_connection(conn):
+    """Return a borrowed connection to the pool, discarding it if it has been closed"""
+    _db_pool.putconn(conn, close=bool(conn.closed))
+
+def close_db_pool():
+    """Close all pooled connections; the pool is recreated on next use"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
 # Initialize database table for feedback
 def init_feedback_table():
     """Create feedback table if it doesn't exist"""
     try:
         conn = get_db_connection()
         if conn:
-            cur = conn.cursor()
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS feedback (
-                    id SERIAL PRIMARY KEY,
-                    feedback_text TEXT NOT NULL,
-                    user_email VARCHAR(255),
-                    feedback_type VARCHAR(50),
-                    page VARCHAR(255),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            conn.commit()
-            cur.close()
-            conn.close()
-            print("Feedback table initialized successfully")
+            try:
+                cur = conn.cursor()
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS feedback (
+                        id SERIAL PRIMARY KEY,
+                        feedback_text TEXT NOT NULL,
+                        user_email VARCHAR(255),
+                        feedback_type VARCHAR(50),
+                        page VARCHAR(255),
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                conn.commit()
+                cur.close()
+                print("Feedback table initialized successfully")
+            finally:
+                release_db_connection(conn)
     except Exception as e:
         print(f"Error initializing feedback table: {str(e)}")
 
 # Initialize table on startup
 init_feedback_table()
 
-# In-memory storage for used tokens and analysis data (use Redis or database in production)
-used_tokens = set()
-# Store analysis data by token for persistence
-analysis_storage = {}  # token -> {analysis_data, email, timestamp}
-# Store verified emails with timestamp (email -> timestamp)
-verified_emails = {}  # Tracks emails that have been verified
-# Store premium payments (email -> {session_id, payment_status, timestamp})
+# Feedback is written by a background thread in batches rather than one
+# INSERT + commit per request
+FEEDBACK_BATCH_SIZE = 500
+FEEDBACK_FLUSH_SECONDS = 1.0
+_feedback_queue = queue.Queue(maxsize=10000)  # (feedback_text, user_email, feedback_type, page)
+
+FEEDBACK_INSERT_SQL = '''
+    INSERT INTO feedback (feedback_text, user_email, feedback_type, page)
+    VALUES (%s, %s, %s, %s)
+'''
+
+def write_feedback_batch(rows):
+    """Insert a batch of feedback rows with a single commit
+    
+    If the batch insert fails, the rows are retried one at a time so a single
+    bad row doesn't take the rest of the batch down with it.
+    """
+    conn = get_db_connection()
+    if not conn:
+        # Fallback if database not available
+        for feedback_text, user_email, feedback_type, page in rows:
+            print(f"Feedback received (no DB): {feedback_type} from {user_email}: {feedback_text}")
+        return
+    
+    try:
+        cur = conn.cursor()
+        try:
+            cur.executemany(FEEDBACK_INSERT_SQL, rows)
+            conn.commit()
+            print(f"Stored {len(rows)} feedback entries")
+        except Exception as db_error:
+            print(f"Database error: {str(db_error)} - retrying {len(rows)} feedback rows individually")
+            conn.rollback()
+            stored = 0
+            for row in rows:
+                try:
+                    cur.execute(FEEDBACK_INSERT_SQL, row)
+                    conn.commit()
+                    stored += 1
+                except Exception as row_error:
+                    conn.rollback()
+                    print(f"Dropped feedback row from {row[1]}: {str(row_error)}")
+            print(f"Stored {stored} of {len(rows)} feedback entries")
+        cur.close()
+    except Exception as db_error:
+        print(f"Database error: {str(db_error)}")
+        conn.rollback()
+    finally:
+        release_db_connection(conn)
+
+def _feedback_writer_loop():
+    """Drain the feedback queue, flushing every FEEDBACK_BATCH_SIZE rows or FEEDBACK_FLUSH_SECONDS"""
+    while True:
+        rows = [_feedback_queue.get()]
+        deadline = time.monotonic() + FEEDBACK_FLUSH_SECONDS
+        while len(rows) < FEEDBACK_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(_feedback_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            write_feedback_batch(rows)
+        except Exception as e:
+            print(f"Error writing feedback batch: {str(e)}")
+
+def flush_feedback_queue():
+    """Write out any feedback still queued, so a worker restart or deploy doesn't drop it"""
+    rows = []
+    while True:
+        try:
+            rows.append(_feedback_queue.get_nowait())
+        except queue.Empty:
+            break
+    
+    for start in range(0, len(rows), FEEDBACK_BATCH_SIZE):
+        try:
+            write_feedback_batch(rows[start:start + FEEDBACK_BATCH_SIZE])
+        except Exception as e:
+            print(f"Error flushing feedback on shutdown: {str(e)}")
+
+# gunicorn workers exit normally on SIGTERM, so this also runs on deploys
+atexit.register(flush_feedback_queue)
+
+def init_premium_payments_table():
+    """Create premium_payments table if it doesn't exist"""
+    try:
+        conn = get_db_connection()
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS premium_payments (
+                        email VARCHAR(255) PRIMARY KEY,
+                        session_id VARCHAR(255) NOT NULL,
+                        payment_status VARCHAR(50) NOT NULL,
+                        amount INTEGER,
+                        currency VARCHAR(10),
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                conn.commit()
+                cur.close()
+                print("Premium payments table initialized successfully")
+            finally:
+                release_db_connection(conn)
+    except Exception as e:
+        print(f"Error initializing premium payments table: {str(e)}")
+
+# Initialize table on startup
+init_premium_payments_table()
+
+# Startup is done with the database. Don't hold its connections in a gunicorn
+# --preload master, where forked workers would end up sharing the sockets
+close_db_pool()
+
+def save_premium_payment(email, session_id, payment_status, amount, currency):
+    """Record a premium purchase, shared across workers when the database is available"""
+    conn = get_db_connection()
+    if not conn:
+        # Fallback if database not available (per-process only)
+        premium_payments[email] = {
+            'session_id': session_id,
+            'payment_status': payment_status,
+            'timestamp': datetime.now().isoformat(),
+            'amount': amount,
+            'currency': currency
+        }
+        return
+    
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT INTO premium_payments (email, session_id, payment_status, amount, currency)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (email) DO UPDATE SET
+                session_id = EXCLUDED.session_id,
+                payment_status = EXCLUDED.payment_status,
+                amount = EXCLUDED.amount,
+                currency = EXCLUDED.currency,
+                timestamp = CURRENT_TIMESTAMP
+        ''', (email, session_id, payment_status, amount, currency))
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+def has_premium_access(email):
+    """Return True if email has a paid premium purchase"""
+    conn = get_db_connection()
+    if not conn:
+        record = premium_payments.get(email)
+        return record is not None and record['payment_status'] == 'paid'
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM premium_payments WHERE email = %s AND payment_status = 'paid'",
+            (email,)
+        )
+        found = cur.fetchone() is not None
+        cur.close()
+        return found
+    finally:
+        release_db_connection(conn)
+
+# Magic link tokens live for 24 hours, so anything keyed by token expires with them
+TOKEN_TTL_SECONDS = 24 * 3600
+TOKEN_CACHE_MAXSIZE = 100000
+CLEANUP_INTERVAL_SECONDS = 5 * 60
+
+# Token state lives in Redis when REDIS_URL is set, so every worker sees the same
+# single-use flags and Redis TTLs expire entries on their own
+REDIS_URL = os.environ.get('REDIS_URL')
+redis_client = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+
+# In-memory fallback for used tokens and analysis data (per-process only), keyed by
+# the token's 16-char jti rather than the full JWT
+# TTLCache bounds both size and lifetime, so expired entries are evicted automatically
+used_tokens = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_TTL_SECONDS)  # jti -> True
+# Store analysis data by jti for persistence
+analysis_storage = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_TTL_SECONDS)  # jti -> {analysis_data, email, timestamp, exp}
+# TTLCache is not thread-safe (even reads reorder entries) and email callbacks
+# touch used_tokens from worker threads, so all access goes through this lock
+_storage_lock = threading.Lock()
+# Premium payments live in Postgres; this dict is only the no-database fallback
+# (email -> {session_id, payment_status, timestamp})
 premium_payments = {}  # Tracks premium purchases
 
 # UK Solar Market Data (December 2025) - Updated Verdict System
@@ -137,15 +424,54 @@ VERDICT_DEFINITIONS = {
     }
 }
 
-# Legacy grade mapping for backward compatibility
-SOLAR_PRICING_TIERS = {
-    'A': {'min': 700, 'max': 1000, 'description': 'Competitive pricing - within normal market range'},
-    'B': {'min': 1000, 'max': 1200, 'description': 'Good value - competitive pricing'},
-    'C': {'min': 1200, 'max': 1400, 'description': 'Fair value - around market average'},
-    'D': {'min': 1400, 'max': 1600, 'description': 'Above market rate - room to negotiate'},
-    'F': {'min': 1600, 'max': 5000, 'description': 'Significantly above market - seek alternative quotes'}
+# Response fields that depend only on the verdict, built once per verdict type
+VERDICT_RESPONSE_FIELDS = {
+    verdict_type: {
+        'verdict_type': verdict_type,
+        'verdict_label': verdict['label'],
+        'verdict_icon': verdict['icon'],
+        'verdict_summary': verdict['summary'],
+        'verdict_color': verdict['color'],
+        'grade': verdict['grade'],
+        'verdict': verdict['summary']  # Legacy field for the old frontend
+    }
+    for verdict_type, verdict in VERDICT_DEFINITIONS.items()
 }
 
+# The INCOMPLETE response is entirely static, so serialize it once at import
+_INCOMPLETE_BODY = orjson.dumps({
+    'verdict_type': 'INCOMPLETE',
+    'verdict_label': VERDICT_DEFINITIONS['INCOMPLETE']['label'],
+    'verdict_icon': VERDICT_DEFINITIONS['INCOMPLETE']['icon'],
+    'verdict_summary': VERDICT_DEFINITIONS['INCOMPLETE']['summary'],
+    'verdict_color': VERDICT_DEFINITIONS['INCOMPLETE']['color'],
+    'grade': VERDICT_DEFINITIONS['INCOMPLETE']['grade'],
+    'recommendations': [
+        'Please provide the system size in kW (e.g., 4.0 for a 4kW system)',
+        'Please provide the total quoted price including installation'
+    ],
+    'next_checks': [
+        'Confirm total system size (kWp)',
+        'Confirm total price including VAT and installation'
+    ]
+})
+
+# Legacy grade mapping for backward compatibility; read-only, since the bisect
+# tables below are derived from it once at import
+PricingTier = namedtuple('PricingTier', 'min max description')
+
+SOLAR_PRICING_TIERS = MappingProxyType({
+    'A': PricingTier(700, 1000, 'Competitive pricing - within normal market range'),
+    'B': PricingTier(1000, 1200, 'Good value - competitive pricing'),
+    'C': PricingTier(1200, 1400, 'Fair value - around market average'),
+    'D': PricingTier(1400, 1600, 'Above market rate - room to negotiate'),
+    'F': PricingTier(1600, 5000, 'Significantly above market - seek alternative quotes')
+})
+
+# Tiers sorted by upper bound for bisect lookup in determine_grade
+_TIERS_BY_MAX = sorted(SOLAR_PRICING_TIERS.items(), key=lambda item: item[1].max)
+_TIER_MAXES = [tier.max for _, tier in _TIERS_BY_MAX]
+
 BATTERY_BRANDS = {
     'Tesla Powerwall': {'capacity': 13.5, 'efficiency': 0.9},
     'Enphase': {'capacity': 10.1, 'efficiency': 0.89},
@@ -212,121 +538,437 @@ def determine_verdict(solar_cost_per_kwp, battery_cost_per_kwh, battery_kwh, tot
     return 'GOOD_VALUE'
 
 
+def determine_grade(price_per_kw):
+    """Return (grade, tier) for a price per kW from SOLAR_PRICING_TIERS
+    
+    Tier bounds are inclusive and a price on a boundary belongs to the cheaper
+    tier. Prices below the A tier grade as A, prices above the F tier as F.
+    NaN has no tier (bisect would place it in A) and raises ValueError.
+    """
+    if math.isnan(price_per_kw):
+        raise ValueError('price per kW is not a number')
+    index = min(bisect.bisect_left(_TIER_MAXES, price_per_kw), len(_TIERS_BY_MAX) - 1)
+    return _TIERS_BY_MAX[index]
+
+
+# Legacy market average price per kW that potential savings are measured against
+MARKET_AVERAGE_PER_KW = 2150
+
+def grade_quote(system_size, total_price):
+    """Legacy grade and savings for a quote; system_size must be > 0
+    
+    Returns (grade, tier, price_per_kw, potential_savings) with the two
+    amounts rounded to pence. Shared by the magic link and premium paths.
+    """
+    price_per_kw = total_price / system_size
+    grade, tier = determine_grade(price_per_kw)
+    # Nothing to save at or below the market average
+    potential_savings = max(0, (price_per_kw - MARKET_AVERAGE_PER_KW) * system_size)
+    return grade, tier, round(price_per_kw, 2), round(potential_savings, 2)
+
+
+# Static recommendation/check lists per verdict; conditional items are spliced in
+_REC_UNDERPRICED = (
+    'Request a detailed breakdown of what\'s included in the price',
+    'Confirm scaffolding, DNO/G99 application, and MCS certification are included',
+    'Check warranty terms for panels, inverter, and workmanship',
+    'Verify the installer\'s MCS registration and reviews'
+)
+_REC_GOOD_VALUE_PREFIX = ('This appears to be a fair price for the system specified',)
+_REC_GOOD_VALUE_SUFFIX = ('Still worth getting 2-3 quotes to compare',)
+_REC_OVERPRICED_PREFIX = ('This quote appears to be above market rates',)
+_REC_OVERPRICED_SUFFIX = (
+    'We recommend getting additional quotes for comparison',
+    'Consider negotiating - there may be room to reduce the price'
+)
+_REC_OVERPRICED_SOLAR = 'Solar pricing (£{solar_cost_per_kwp:.0f}/kWp) is significantly above the £900-1200/kWp normal range'
+_REC_OVERPRICED_BATTERY = 'Battery pricing (£{battery_cost_per_kwh:.0f}/kWh) is above the £500-750/kWh normal range'
+
+_CHECKS_UNDERPRICED = (
+    'Confirm scaffolding is included',
+    'Confirm DNO/G99 notification is included',
+    'Confirm MCS certification will be provided',
+    'Check panel and inverter warranty terms',
+    'Verify workmanship warranty (minimum 2 years recommended)',
+    'Ask about bird proofing if needed'
+)
+_CHECKS_GOOD_VALUE = (
+    'Review the full specification matches your requirements',
+    'Check installer reviews and MCS registration',
+    'Confirm payment terms and deposit amount'
+)
+_CHECKS_OVERPRICED = (
+    'Get 2-3 additional quotes for comparison',
+    'Ask the installer to justify the pricing',
+    'Check if premium components justify the higher price',
+    'Consider negotiating or requesting a price match'
+)
+_CHECKS_INCOMPLETE = (
+    'Confirm total system size (kWp)',
+    'Confirm total price including VAT and installation'
+)
+_CHECK_BATTERY_WARRANTY = 'Confirm battery warranty (typically 10 years)'
+_CHECK_BATTERY_CAPACITY = 'Confirm battery capacity (kWh)'
+
+
 def generate_recommendations(verdict_type, solar_cost_per_kwp, battery_cost_per_kwh, delta_vs_expected):
     """Generate dynamic recommendations based on verdict and analysis"""
-    recommendations = []
-    
     if verdict_type == 'UNDERPRICED':
-        recommendations.append('Request a detailed breakdown of what\'s included in the price')
-        recommendations.append('Confirm scaffolding, DNO/G99 application, and MCS certification are included')
-        recommendations.append('Check warranty terms for panels, inverter, and workmanship')
-        recommendations.append('Verify the installer\'s MCS registration and reviews')
+        return list(_REC_UNDERPRICED)
     
-    elif verdict_type == 'GOOD_VALUE':
-        recommendations.append('This appears to be a fair price for the system specified')
+    if verdict_type == 'GOOD_VALUE':
         if delta_vs_expected < -10:
-            recommendations.append('Slightly below average pricing - good negotiation or competitive installer')
+            middle = ('Slightly below average pricing - good negotiation or competitive installer',)
         elif delta_vs_expected > 10:
-            recommendations.append('Slightly above average - you may be able to negotiate 5-10% off')
-        recommendations.append('Still worth getting 2-3 quotes to compare')
+            middle = ('Slightly above average - you may be able to negotiate 5-10% off',)
+        else:
+            middle = ()
+        return [*_REC_GOOD_VALUE_PREFIX, *middle, *_REC_GOOD_VALUE_SUFFIX]
     
-    elif verdict_type == 'OVERPRICED':
-        recommendations.append('This quote appears to be above market rates')
+    if verdict_type == 'OVERPRICED':
+        recommendations = list(_REC_OVERPRICED_PREFIX)
         if solar_cost_per_kwp > 1400:
-            recommendations.append(f'Solar pricing (£{solar_cost_per_kwp:.0f}/kWp) is significantly above the £900-1200/kWp normal range')
+            recommendations.append(_REC_OVERPRICED_SOLAR.format(solar_cost_per_kwp=solar_cost_per_kwp))
         if battery_cost_per_kwh and battery_cost_per_kwh > 800:
-            recommendations.append(f'Battery pricing (£{battery_cost_per_kwh:.0f}/kWh) is above the £500-750/kWh normal range')
-        recommendations.append('We recommend getting additional quotes for comparison')
-        recommendations.append('Consider negotiating - there may be room to reduce the price')
+            recommendations.append(_REC_OVERPRICED_BATTERY.format(battery_cost_per_kwh=battery_cost_per_kwh))
+        recommendations.extend(_REC_OVERPRICED_SUFFIX)
+        return recommendations
     
-    return recommendations
+    return []
 
 
 def generate_next_checks(verdict_type, has_battery):
     """Generate a list of next steps/checks based on verdict"""
-    checks = []
-    
     if verdict_type == 'UNDERPRICED':
-        checks.append('Confirm scaffolding is included')
-        checks.append('Confirm DNO/G99 notification is included')
-        checks.append('Confirm MCS certification will be provided')
-        checks.append('Check panel and inverter warranty terms')
-        checks.append('Verify workmanship warranty (minimum 2 years recommended)')
-        checks.append('Ask about bird proofing if needed')
         if has_battery:
-            checks.append('Confirm battery warranty (typically 10 years)')
+            return [*_CHECKS_UNDERPRICED, _CHECK_BATTERY_WARRANTY]
+        return list(_CHECKS_UNDERPRICED)
     
-    elif verdict_type == 'GOOD_VALUE':
-        checks.append('Review the full specification matches your requirements')
-        checks.append('Check installer reviews and MCS registration')
-        checks.append('Confirm payment terms and deposit amount')
+    if verdict_type == 'GOOD_VALUE':
+        return list(_CHECKS_GOOD_VALUE)
     
-    elif verdict_type == 'OVERPRICED':
-        checks.append('Get 2-3 additional quotes for comparison')
-        checks.append('Ask the installer to justify the pricing')
-        checks.append('Check if premium components justify the higher price')
-        checks.append('Consider negotiating or requesting a price match')
+    if verdict_type == 'OVERPRICED':
+        return list(_CHECKS_OVERPRICED)
     
-    elif verdict_type == 'INCOMPLETE':
-        checks.append('Confirm total system size (kWp)')
-        checks.append('Confirm total price including VAT and installation')
+    if verdict_type == 'INCOMPLETE':
         if has_battery:
-            checks.append('Confirm battery capacity (kWh)')
+            return [*_CHECKS_INCOMPLETE, _CHECK_BATTERY_CAPACITY]
+        return list(_CHECKS_INCOMPLETE)
+    
+    return []
+
+
+# Required premium quote fields; the set makes the all-present check one difference
+PREMIUM_REQUIRED_FIELDS = ('system_size', 'total_price', 'user_email')
+PREMIUM_REQUIRED_FIELD_SET = frozenset(PREMIUM_REQUIRED_FIELDS)
+
+def finite_float(value):
+    """float() that also rejects 'nan' and 'inf', which float() happily parses"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'{value!r} is not a finite number')
+    return number
+
+# Optional premium quote fields as (name, coerce, default, gate); coerce=None keeps
+# the raw value, and a gated field takes its default unless the gate field is truthy
+PREMIUM_FIELD_SPECS = (
+    # Panel details
+    ('panel_brand', None, '', None),
+    ('panel_model', None, '', None),
+    ('panel_wattage', finite_float, 0, None),
+    ('panel_quantity', int, 0, None),
+    # Inverter details
+    ('inverter_brand', None, '', None),
+    ('inverter_model', None, '', None),
+    ('inverter_type', None, '', None),
+    ('inverter_capacity', finite_float, 0, None),
+    # Battery details
+    ('has_battery', None, False, None),
+    ('battery_brand', None, '', None),
+    ('battery_model', None, '', None),
+    ('battery_capacity', finite_float, 0, 'has_battery'),
+    ('battery_quantity', int, 0, 'has_battery'),
+    ('battery_warranty', int, 0, 'has_battery'),
+    # Installation details
+    ('scaffolding_included', None, False, None),
+    ('scaffolding_cost', finite_float, 0, 'scaffolding_included'),
+    ('bird_protection_included', None, False, None),
+    ('bird_protection_cost', finite_float, 0, 'bird_protection_included'),
+    ('roof_type', None, '', None),
+    ('roof_material', None, '', None),
+    # Installer information
+    ('installer_company', None, '', None),
+    ('installer_location', None, '', None),
+    ('installer_mcs', None, '', None),
+    ('installer_years_in_business', int, 0, None),
+    ('installer_warranty_years', int, 0, None),
+    ('installation_timeline', None, '', None),
+)
+
+
+def parse_premium_fields(data):
+    """Read and coerce every PREMIUM_FIELD_SPECS field from data in one pass"""
+    fields = {}
+    for name, coerce, default, gate in PREMIUM_FIELD_SPECS:
+        if gate and not fields[gate]:
+            fields[name] = default
+            continue
+        value = data.get(name, default)
+        if coerce is None:
+            fields[name] = value
+        elif value is None or value == '':
+            # Blank or null numeric form inputs take the default instead of failing coercion
+            fields[name] = default
+        else:
+            fields[name] = coerce(value)
+    return fields
+
+
+# Premium analysis findings as (predicate, bucket, template) rules, evaluated in
+# order against a context dict; templates are filled with str.format_map
+PREMIUM_FINDING_RULES = (
+    (lambda c: c['has_panels'] and c['size_difference'] >= 0.5, 'red_flags',
+     'System size mismatch: {panel_quantity} x {panel_wattage}W panels = {calculated_system_size:.2f}kW, but quote states {system_size}kW'),
+    (lambda c: c['has_panels'] and c['size_difference'] >= 0.5, 'questions_to_ask',
+     'Can you clarify the discrepancy between the number of panels and the stated system size?'),
+    (lambda c: c['has_inverter'] and c['inverter_ratio'] < 80, 'red_flags',
+     'Inverter may be undersized: {inverter_capacity}kW inverter for {system_size}kW system ({inverter_ratio:.0f}% ratio)'),
+    (lambda c: c['has_inverter'] and c['inverter_ratio'] < 80, 'things_to_consider',
+     'An undersized inverter may limit system performance and energy production'),
+    (lambda c: c['has_inverter'] and c['inverter_ratio'] > 110, 'things_to_consider',
+     'Inverter is oversized ({inverter_ratio:.0f}% ratio), which may increase costs without significant benefit'),
+    (lambda c: c['has_battery'] and c['total_battery_capacity'] < c['recommended_min'], 'things_to_consider',
+     'Battery capacity ({total_battery_capacity:.1f}kWh) is below typical recommendation ({recommended_min:.1f}-{recommended_max:.1f}kWh for a {system_size}kW system)'),
+    (lambda c: c['has_battery'] and c['total_battery_capacity'] < c['recommended_min'], 'questions_to_ask',
+     'Have you calculated the battery size based on your actual energy consumption patterns?'),
+    (lambda c: c['has_battery'] and c['battery_warranty'] < 10, 'things_to_consider',
+     'Battery warranty is {battery_warranty} years. Many premium batteries offer 10+ year warranties'),
+    (lambda c: c['scaffolding_included'] and c['scaffolding_per_kw'] > 150, 'things_to_consider',
+     'Scaffolding cost (£{scaffolding_cost}) seems high at £{scaffolding_per_kw:.0f}/kW'),
+    (lambda c: c['bird_protection_included'] and c['bird_protection_cost'] > 500, 'things_to_consider',
+     'Bird protection cost (£{bird_protection_cost}) is above typical market rates (£200-400)'),
+    (lambda c: not c['has_mcs'], 'red_flags',
+     'Installer does not appear to be MCS certified - this is REQUIRED for SEG payments and government incentives'),
+    (lambda c: not c['has_mcs'], 'questions_to_ask',
+     'Can you provide your MCS certification number? This is essential for claiming SEG payments.'),
+    (lambda c: c['installer_years_in_business'] < 2, 'things_to_consider',
+     'Installer has been in business for {installer_years_in_business} year(s). Consider checking reviews and references'),
+    (lambda c: c['installer_warranty_years'] < 5, 'things_to_consider',
+     'Installation warranty is {installer_warranty_years} years. Industry standard is typically 5-10 years'),
+    (lambda c: c['installer_warranty_years'] < 5, 'questions_to_ask',
+     'What does the installation warranty cover, and can it be extended?'),
+)
+
+
+def evaluate_premium_findings(context):
+    """Apply PREMIUM_FINDING_RULES to a context dict
+    
+    Returns a dict with 'red_flags', 'things_to_consider' and 'questions_to_ask'
+    lists, each in rule order.
+    """
+    findings = {'red_flags': [], 'things_to_consider': [], 'questions_to_ask': []}
+    for predicate, bucket, template in PREMIUM_FINDING_RULES:
+        if predicate(context):
+            findings[bucket].append(template.format_map(context))
+    return findings
+
+
+# Deliberately loose address check (something@domain.tld, no spaces) so a typo
+# is caught before it reaches a Resend batch shared with other users
+EMAIL_MAX_LENGTH = 254
+_EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+def is_valid_email(email):
+    """True if email is a string that looks like a deliverable address"""
+    return (isinstance(email, str) and len(email) <= EMAIL_MAX_LENGTH
+            and _EMAIL_RE.fullmatch(email) is not None)
+
+
+# Numeric fields the frontend may send as display strings like '£12,345'
+MONEY_FIELDS = ('system_size', 'total_price', 'price_per_kw', 'potential_savings')
+_MONEY_RE = re.compile(r'[£,\s]')
+
+def normalize_money_fields(analysis_data):
+    """Convert string values of MONEY_FIELDS to floats in place
     
-    return checks
+    Values that are already numbers, or strings that don't parse, are left as-is.
+    Strings that parse to nan or infinity raise ValueError.
+    """
+    for field in MONEY_FIELDS:
+        value = analysis_data.get(field)
+        if isinstance(value, str):
+            try:
+                number = float(_MONEY_RE.sub('', value))
+            except ValueError:
+                continue
+            if not math.isfinite(number):
+                raise ValueError(f'{field} must be a finite number')
+            analysis_data[field] = number
 
 
-def generate_magic_link_token(email, analysis_data):
-    """Generate a JWT token for magic link authentication"""
+def generate_magic_link_token(email):
+    """Generate a JWT token for magic link authentication
+    
+    Returns (token, jti); server-side state is keyed by the short jti. The
+    analysis itself stays server-side, which keeps the token and link short.
+    """
     # Generate unique token ID to prevent replay attacks
-    jti = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
+    jti = secrets.token_urlsafe(12)  # 16 URL-safe chars from the OS CSPRNG
     
+    # PyJWT accepts epoch seconds directly, no datetime objects needed
+    now = int(time.time())
     payload = {
         'email': email,
-        'analysis_data': analysis_data,
-        'exp': datetime.utcnow() + timedelta(hours=24),  # 24 hour expiration for cross-device access
-        'iat': datetime.utcnow(),
+        'exp': now + TOKEN_TTL_SECONDS,  # 24 hour expiration for cross-device access
+        'iat': now,
         'jti': jti  # JWT ID for single-use enforcement
     }
     
     token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
-    return token
+    return token, jti
 
 def cleanup_expired_data():
-    """Remove expired tokens and analysis data to prevent memory leaks"""
-    current_time = datetime.utcnow()
-    expired_tokens = []
+    """Purge expired tokens and analysis data from the TTL caches
     
-    for token, data in list(analysis_storage.items()):
+    The caches already evict lazily on access, so this is only needed to
+    release memory eagerly. Returns the number of entries removed.
+    """
+    with _storage_lock:
+        expired = analysis_storage.expire()
+        used_tokens.expire()
+    return len(expired)
+
+def _cleanup_loop():
+    """Purge expired token data on a fixed interval, off the request path"""
+    while True:
+        time.sleep(CLEANUP_INTERVAL_SECONDS)
         try:
-            # Try to decode token to check expiration
-            jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        except jwt.ExpiredSignatureError:
-            # Token has expired, mark for removal
-            expired_tokens.append(token)
-        except jwt.InvalidTokenError:
-            # Invalid token, mark for removal
-            expired_tokens.append(token)
+            removed = cleanup_expired_data()
+            if removed:
+                print(f"Cleaned up {removed} expired magic link entries")
+        except Exception as e:
+            print(f"Error cleaning up expired data: {str(e)}")
+
+def store_analysis(jti, record):
+    """Save the analysis record for a magic link token"""
+    if redis_client is not None:
+        redis_client.set(f'analysis:{jti}', orjson.dumps(record), ex=TOKEN_TTL_SECONDS)
+        return
+    with _storage_lock:
+        analysis_storage[jti] = record
+
+# Fetch a token's analysis record and claim it in one atomic round trip;
+# returns nil when there is no record (without claiming), else {record, first_use}
+_LOAD_AND_CLAIM_LUA = """
+local data = redis.call('GET', KEYS[1])
+if not data then
+    return nil
+end
+local first = redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[1])
+return {data, first and 1 or 0}
+"""
+_load_and_claim_script = redis_client.register_script(_LOAD_AND_CLAIM_LUA) if redis_client is not None else None
+
+def load_and_claim(jti):
+    """Return (record, first_use) for a token, marking it as used
     
-    # Remove expired tokens from storage
-    for token in expired_tokens:
-        analysis_storage.pop(token, None)
-        used_tokens.discard(token)
+    first_use is True only for the first caller. A token with no stored
+    record returns (None, False) and is not marked.
+    """
+    if redis_client is not None:
+        result = _load_and_claim_script(keys=[f'analysis:{jti}', f'used:{jti}'], args=[TOKEN_TTL_SECONDS])
+        if not result:
+            return None, False
+        return orjson.loads(result[0]), result[1] == 1
+    with _storage_lock:
+        record = analysis_storage.get(jti)
+        if record is None:
+            return None, False
+        first_use = jti not in used_tokens
+        if first_use:
+            used_tokens[jti] = True
+        return record, first_use
+
+def claim_token(jti):
+    """Mark a token as used; returns True only for the first caller"""
+    if redis_client is not None:
+        # SET NX is atomic, so two workers can't both see a first use
+        return bool(redis_client.set(f'used:{jti}', 1, nx=True, ex=TOKEN_TTL_SECONDS))
+    with _storage_lock:
+        if jti in used_tokens:
+            return False
+        used_tokens[jti] = True
+        return True
+
+def release_token(jti):
+    """Clear a token's used flag so it can be claimed again"""
+    if redis_client is not None:
+        redis_client.delete(f'used:{jti}')
+        return
+    with _storage_lock:
+        used_tokens.pop(jti, None)
+
+def _b64url_decode(segment):
+    """Decode an unpadded base64url JWT segment"""
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+# The header segment of every token generate_magic_link_token mints; the fast
+# path only handles tokens carrying exactly this header
+_JWT_HEADER_SEGMENT = jwt.encode({}, JWT_SECRET, algorithm='HS256').partition('.')[0]
+
+def decode_token_fast(token):
+    """Verify one of our HS256 tokens directly with hmac, bypassing PyJWT
     
-    return len(expired_tokens)
+    Returns the payload for a correctly signed, unexpired token, or None if the
+    token needs PyJWT's full validation (bad signature, expired, malformed, or
+    any header other than the one we mint).
+    """
+    try:
+        signing_input, _, signature = token.rpartition('.')
+        header_segment, _, payload_segment = signing_input.partition('.')
+        if header_segment != _JWT_HEADER_SEGMENT:
+            return None
+        expected = hmac.new(JWT_SECRET_BYTES, signing_input.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            return None
+        
+        payload = orjson.loads(_b64url_decode(payload_segment))
+        if payload['exp'] <= time.time():
+            return None
+        return payload
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+# Recently verified payloads keyed by sha256(token), so repeat clicks and retries
+# skip the HMAC and JSON parse; expiry is still checked on every hit
+TOKEN_PAYLOAD_CACHE_TTL_SECONDS = 30
+_token_payload_cache = TTLCache(maxsize=10000, ttl=TOKEN_PAYLOAD_CACHE_TTL_SECONDS)
+_token_payload_lock = threading.Lock()
 
 def verify_magic_link_token(token, mark_as_used=True):
     """Verify and decode JWT token"""
+    if not isinstance(token, str):
+        return None, 'Invalid token'
+    
     try:
         # Allow token reuse for cross-device access
         # Single-use enforcement removed to support opening links on different devices
         
-        # Decode and verify token
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        cache_key = hashlib.sha256(token.encode()).digest()
+        with _token_payload_lock:
+            payload = _token_payload_cache.get(cache_key)
+        
+        if payload is None or payload['exp'] <= time.time():
+            # Decode and verify token, falling back to PyJWT for its error reporting
+            payload = decode_token_fast(token)
+            if payload is None:
+                payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            with _token_payload_lock:
+                _token_payload_cache[cache_key] = payload
         
         # Mark token as used only if requested (for PDF delivery)
         if mark_as_used:
-            used_tokens.add(token)
+            claim_token(payload['jti'])
         
         return payload, None
     except jwt.ExpiredSignatureError:
@@ -334,38 +976,22 @@ def verify_magic_link_token(token, mark_as_used=True):
     except jwt.InvalidTokenError:
         return None, 'Invalid token'
 
-def send_magic_link_email(email, token):
-    """Send magic link via Resend"""
-    try:
-        magic_link = f"{FRONTEND_URL}/verify?token={token}"
-        
-        html_content = f'''
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                .header {{
-                    background: linear-gradient(135deg, #f97316 0%, #ea580c 100%);
-                    color: white;
-                    padding: 30px;
-                    text-align: center;
-                    border-radius: 8px 8px 0 0;
-                }}
-                .content {{
-                    background: #f9f9f9;
-                    padding: 30px;
-                    border-radius: 0 0 8px 8px;
-                }}
-                .button {{
+# Layout CSS shared by the magic link and PDF delivery emails
+EMAIL_BASE_STYLES = '''                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+                .header { background: linear-gradient(135deg, #f97316 0%, #ea580c 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
+                .content { background: #f9f9f9; padding: 30px; border-radius: 0 0 8px 8px; }
+                .footer { text-align: center; margin-top: 20px; color: #888; font-size: 12px; }'''
+
+def minify_css(css):
+    """Collapse a CSS block to one line, dropping optional whitespace and semicolons"""
+    css = re.sub(r'\s*([{};:,])\s*', r'\1', re.sub(r'\s+', ' ', css).strip())
+    return css.replace(';}', '}')
+
+# Every email carries its CSS inline (mail clients strip <link>), so it is
+# minified once here to keep each Resend payload small
+MAGIC_LINK_EMAIL_CSS = minify_css(EMAIL_BASE_STYLES + '''
+                .button {
                     display: inline-block;
                     background: #f97316;
                     color: white;
@@ -374,20 +1000,25 @@ def send_magic_link_email(email, token):
                     border-radius: 5px;
                     font-weight: bold;
                     margin: 20px 0;
-                }}
-                .footer {{
-                    text-align: center;
-                    margin-top: 20px;
-                    color: #888;
-                    font-size: 12px;
-                }}
-                .note {{
+                }
+                .note {
                     background: #fff3cd;
                     border-left: 4px solid #ffc107;
                     padding: 15px;
                     margin: 20px 0;
-                }}
-            </style>
+                }
+''')
+PDF_EMAIL_CSS = minify_css(EMAIL_BASE_STYLES + '''
+                .grade { font-size: 48px; font-weight: bold; text-align: center; color: #f97316; margin: 20px 0; }
+                .analysis-box { background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }
+''')
+
+# Email bodies are built once at import; string.Template keeps the CSS braces literal.
+# Substituted values are HTML-escaped by the callers.
+MAGIC_LINK_EMAIL_TEMPLATE = string.Template('''
+        <html>
+        <head>
+            <style>''' + MAGIC_LINK_EMAIL_CSS + '''</style>
         </head>
         <body>
             <div class="container">
@@ -400,7 +1031,7 @@ def send_magic_link_email(email, token):
                     <p>Thank you for using our solar quote analysis service. Click the button below to verify your email and access your free analysis results and Solar Buyer's Guide:</p>
                     
                     <div style="text-align: center;">
-                        <a href="{magic_link}" class="button">Verify Email & Get My Results</a>
+                        <a href="$magic_link" class="button">Verify Email & Get My Results</a>
                     </div>
                     
                     <div class="note">
@@ -409,7 +1040,7 @@ def send_magic_link_email(email, token):
                     </div>
                     
                     <p>If the button doesn't work, copy and paste this link into your browser:</p>
-                    <p style="word-break: break-all; color: #f97316;">{magic_link}</p>
+                    <p style="word-break: break-all; color: #f97316;">$magic_link</p>
                     
                     <p style="margin-top: 30px; color: #666;">If you didn't request this email, please ignore it.</p>
                 </div>
@@ -420,58 +1051,12 @@ def send_magic_link_email(email, token):
             </div>
         </body>
         </html>
-        '''
-        
-        return send_email(email, 'Verify Your Email - SolarVerify', html_content)
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return False
+        ''')
 
-def send_pdf_email(email, analysis_data):
-    """Send PDF guide via email after verification using Resend"""
-    try:
-        # Read the PDF file
-        pdf_path = os.path.join(os.path.dirname(__file__), 'solar_verify_professional_guide_final.pdf')
-        with open(pdf_path, 'rb') as f:
-            pdf_data = f.read()
-        
-        # Encode PDF to base64
-        encoded_pdf = base64.b64encode(pdf_data).decode()
-        
-        # Handle both nested and flat data structures
-        system_size = analysis_data.get('system_size')
-        total_price = analysis_data.get('total_price')
-        price_per_kw = analysis_data.get('price_per_kw')
-        
-        # Fall back to nested structure if flat values not found
-        if system_size is None and 'analysis' in analysis_data:
-            system_size = analysis_data['analysis'].get('system_size', 'N/A')
-            total_price = analysis_data['analysis'].get('total_price', 0)
-            price_per_kw = analysis_data['analysis'].get('price_per_kw', 0)
-        
-        # Set defaults if still not found
-        if system_size is None:
-            system_size = 'N/A'
-        if total_price is None:
-            total_price = 0
-        if price_per_kw is None:
-            price_per_kw = 0
-        
-        grade = analysis_data.get('grade', 'N/A')
-        verdict = analysis_data.get('verdict', 'Analysis complete')
-        
-        html_content = f'''
+PDF_EMAIL_TEMPLATE = string.Template('''
         <html>
         <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: linear-gradient(135deg, #f97316 0%, #ea580c 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }}
-                .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 8px 8px; }}
-                .grade {{ font-size: 48px; font-weight: bold; text-align: center; color: #f97316; margin: 20px 0; }}
-                .analysis-box {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                .footer {{ text-align: center; margin-top: 20px; color: #888; font-size: 12px; }}
-            </style>
+            <style>''' + PDF_EMAIL_CSS + '''</style>
         </head>
         <body>
             <div class="container">
@@ -481,11 +1066,11 @@ def send_pdf_email(email, analysis_data):
                 </div>
                 <div class="content">
                     <h2>Your Quote Verdict</h2>
-                    <div class="grade">{verdict}</div>
+                    <div class="grade">$verdict</div>
                     <div class="analysis-box">
-                        <p><strong>System Size:</strong> {system_size}</p>
-                        <p><strong>Total Price:</strong> £{total_price:,.0f}</p>
-                        <p><strong>Price per kW:</strong> £{price_per_kw:.2f}</p>
+                        <p><strong>System Size:</strong> $system_size</p>
+                        <p><strong>Total Price:</strong> £$total_price</p>
+                        <p><strong>Price per kW:</strong> £$price_per_kw</p>
                     </div>
                     <h3>📄 Your Free Solar Buyer's Guide</h3>
                     <p>We've attached "The Complete Solar Quote Buyer's Guide" to this email. This comprehensive guide will help you:</p>
@@ -503,20 +1088,201 @@ def send_pdf_email(email, analysis_data):
             </div>
         </body>
         </html>
-        '''
+        ''')
+
+MAGIC_LINK_SUBJECT = 'Verify Your Email - SolarVerify'
+
+def render_magic_link_email(token):
+    """Return the magic link email HTML for a token"""
+    magic_link = f"{FRONTEND_URL}/verify?token={token}"
+    return MAGIC_LINK_EMAIL_TEMPLATE.substitute(magic_link=html.escape(magic_link))
+
+def send_magic_link_email(email, token):
+    """Send magic link via Resend"""
+    try:
+        return send_email(email, MAGIC_LINK_SUBJECT, render_magic_link_email(token))
+    except Exception as e:
+        print(f"Error sending email: {str(e)}")
+        return False
+
+# The buyer's guide never changes, so it is read and base64-encoded once at import
+# (Resend's JSON API takes attachments as base64 strings) and the attachment list
+# is shared by every PDF email
+GUIDE_PDF_PATH = os.path.join(os.path.dirname(__file__), 'solar_verify_professional_guide_final.pdf')
+try:
+    with open(GUIDE_PDF_PATH, 'rb') as _guide_pdf:
+        GUIDE_PDF_BASE64 = base64.b64encode(_guide_pdf.read()).decode()
+    GUIDE_PDF_ATTACHMENTS = [{
+        'filename': 'Solar_Buyers_Guide.pdf',
+        'content': GUIDE_PDF_BASE64
+    }]
+except FileNotFoundError:
+    # Keep the API up without the guide; PDF emails fail and release their token
+    print(f"Guide PDF not found at {GUIDE_PDF_PATH} - PDF emails are disabled")
+    GUIDE_PDF_BASE64 = None
+    GUIDE_PDF_ATTACHMENTS = None
+
+def send_pdf_email(email, analysis_data):
+    """Send PDF guide via email after verification using Resend"""
+    if GUIDE_PDF_ATTACHMENTS is None:
+        print(f"Error sending PDF email: guide PDF missing at {GUIDE_PDF_PATH}")
+        return False
+    
+    try:
+        # Handle both flat and nested data structures, then fall back to defaults
+        nested = analysis_data.get('analysis') or {}
+        system_size = analysis_data.get('system_size') or nested.get('system_size') or 'N/A'
+        total_price = analysis_data.get('total_price') or nested.get('total_price') or 0
+        price_per_kw = analysis_data.get('price_per_kw') or nested.get('price_per_kw') or 0
+        
+        grade = analysis_data.get('grade', 'N/A')
+        verdict = analysis_data.get('verdict', 'Analysis complete')
+        
+        # verdict and system_size come from client-supplied analysis_data, so escape them
+        html_content = PDF_EMAIL_TEMPLATE.substitute(
+            verdict=html.escape(str(verdict)),
+            system_size=html.escape(str(system_size)),
+            total_price=f'{total_price:,.0f}',
+            price_per_kw=f'{price_per_kw:.2f}'
+        )
         
         # Send email using Resend
-        return send_email_with_resend(
-            to_email=email,
-            subject="Your Solar Quote Analysis & Free Buyer's Guide",
-            html_content=html_content,
-            attachment_data=encoded_pdf,
-            attachment_filename="Solar_Buyers_Guide.pdf"
+        return send_email(
+            email,
+            "Your Solar Quote Analysis & Free Buyer's Guide",
+            html_content,
+            attachments=GUIDE_PDF_ATTACHMENTS
         )
     except Exception as e:
         print(f"Error sending PDF email: {str(e)}")
         return False
 
+# Background pool for outbound email so Resend latency doesn't block request workers
+_email_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='email')
+
+def _on_pdf_email_done(jti, email):
+    """Build a callback that logs failed PDF sends and frees the token for a retry"""
+    def callback(future):
+        try:
+            sent = future.result()
+        except Exception as e:
+            print(f"Error sending PDF email: {str(e)}")
+            sent = False
+        
+        if not sent:
+            print(f"PDF email to {email} failed - token released for retry")
+            release_token(jti)
+    return callback
+
+def _on_magic_link_email_done(email):
+    """Build a callback that logs failed magic link sends"""
+    def callback(future):
+        try:
+            sent = future.result()
+        except Exception as e:
+            print(f"Error sending magic link email: {str(e)}")
+            sent = False
+        
+        if not sent:
+            print(f"Magic link email to {email} failed")
+    return callback
+
+# Magic links are coalesced: a background thread drains this queue every
+# MAGIC_LINK_BATCH_SECONDS and sends up to RESEND_BATCH_MAX of them per API call
+MAGIC_LINK_BATCH_SECONDS = 0.2
+_magic_link_queue = queue.Queue(maxsize=10000)  # (email, token)
+
+def send_magic_link_batch(items):
+    """Send a batch of (email, token) magic links with a single Resend call"""
+    messages = [{
+        'to_email': email,
+        'subject': MAGIC_LINK_SUBJECT,
+        'html_content': render_magic_link_email(token)
+    } for email, token in items]
+    
+    if send_batch_emails(messages):
+        return
+    
+    # Resend rejects a whole batch for one bad message, so retry each link on its
+    # own; only the messages that fail individually are lost
+    print(f"Magic link batch of {len(messages)} failed - retrying individually")
+    for message in messages:
+        if not send_email(message['to_email'], message['subject'], message['html_content']):
+            print(f"Magic link email to {message['to_email']} failed")
+
+def _magic_link_sender_loop():
+    """Drain the magic link queue, sending every RESEND_BATCH_MAX links or MAGIC_LINK_BATCH_SECONDS"""
+    while True:
+        items = [_magic_link_queue.get()]
+        deadline = time.monotonic() + MAGIC_LINK_BATCH_SECONDS
+        while len(items) < RESEND_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(_magic_link_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            send_magic_link_batch(items)
+        except Exception as e:
+            print(f"Error sending magic link batch: {str(e)}")
+
+# Background threads are started per process on first use, never at import, so a
+# gunicorn --preload master runs none that could hold a lock across fork
+_background_pid = None  # pid of the process whose threads are running
+_background_lock = threading.Lock()
+
+def ensure_background_threads():
+    """Start the feedback writer, magic link sender and (without Redis, which
+    expires its own keys) token cleanup threads, once per process"""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        threading.Thread(target=_feedback_writer_loop, name='feedback-writer', daemon=True).start()
+        threading.Thread(target=_magic_link_sender_loop, name='magic-link-sender', daemon=True).start()
+        if redis_client is None:
+            threading.Thread(target=_cleanup_loop, name='token-cleanup', daemon=True).start()
+        _background_pid = os.getpid()
+
+def _reinit_after_fork():
+    """Give a forked worker fresh locks, queues and background threads
+    
+    Threads don't survive fork, and any lock or queue copied from the parent
+    may have been held mid-operation at the moment of the fork, in which case
+    the child would wait on it forever.
+    """
+    global _db_pool_lock, _storage_lock, _token_payload_lock, _background_lock
+    global _feedback_queue, _magic_link_queue, _email_pool, _background_pid
+    _db_pool_lock = threading.Lock()
+    _storage_lock = threading.Lock()
+    _token_payload_lock = threading.Lock()
+    _background_lock = threading.Lock()
+    _feedback_queue = queue.Queue(maxsize=10000)
+    _magic_link_queue = queue.Queue(maxsize=10000)
+    _email_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='email')
+    _background_pid = None
+    ensure_background_threads()
+
+os.register_at_fork(after_in_child=_reinit_after_fork)
+
+def _on_premium_email_done(email):
+    """Build a callback that logs failed premium report sends"""
+    def callback(future):
+        try:
+            sent = future.result()
+        except Exception as e:
+            print(f"Error sending premium report email: {str(e)}")
+            sent = False
+        
+        if not sent:
+            print(f"Premium report email to {email} failed")
+    return callback
+
 @app.route('/')
 def home():
     """Basic home page"""
@@ -532,26 +1298,54 @@ def home():
         }
     })
 
+_health_body = (0, b'')  # (epoch second, serialized body)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'Solar Verify Analysis API',
-        'timestamp': datetime.now().isoformat()
-    })
+    """Health check endpoint
+    
+    Load balancers poll this constantly, so the body is serialized at most once
+    per second and reused; the timestamp is accurate to that second.
+    """
+    global _health_body
+    second = int(time.time())
+    cached_second, body = _health_body
+    if cached_second != second:
+        body = orjson.dumps({
+            'status': 'healthy',
+            'service': 'Solar Verify Analysis API',
+            'timestamp': datetime.now().isoformat()
+        })
+        # A single tuple assignment, so concurrent requests never see a torn pair
+        _health_body = (second, body)
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/send-magic-link', methods=['POST'])
 def send_magic_link():
     """Send magic link to user's email"""
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         email = data.get('email')
         
         if not email:
             return jsonify({'error': 'Email is required'}), 400
+        if not is_valid_email(email):
+            return jsonify({'error': 'Invalid email address'}), 400
         
         analysis_data = data.get('analysis_data')
+        if analysis_data is not None and not isinstance(analysis_data, dict):
+            return jsonify({'error': 'analysis_data must be a JSON object'}), 400
+        
+        # Store numbers, not '£12,345' strings, so nothing downstream has to re-parse them
+        if analysis_data:
+            try:
+                normalize_money_fields(analysis_data)
+                if isinstance(analysis_data.get('analysis'), dict):
+                    normalize_money_fields(analysis_data['analysis'])
+            except ValueError as e:
+                return error_response('Invalid analysis_data', e, 400)
         
         # Calculate grade from raw data if not already present
         if analysis_data and 'grade' not in analysis_data:
@@ -560,100 +1354,85 @@ def send_magic_link():
                 total_price = float(analysis_data.get('total_price', 0))
                 
                 if system_size > 0 and total_price > 0:
-                    # Calculate price per kW
-                    price_per_kw = total_price / system_size
-                    
-                    # Determine grade
-                    grade = 'F'
-                    grade_info = None
-                    
-                    for grade_letter, tier in SOLAR_PRICING_TIERS.items():
-                        if tier['min'] <= price_per_kw <= tier['max']:
-                            grade = grade_letter
-                            grade_info = tier
-                            break
-                    
-                    if grade_info is None:
-                        if price_per_kw < SOLAR_PRICING_TIERS['A']['min']:
-                            grade = 'A'
-                            grade_info = SOLAR_PRICING_TIERS['A']
-                        else:
-                            grade = 'F'
-                            grade_info = SOLAR_PRICING_TIERS['F']
+                    grade, grade_info, price_per_kw, potential_savings = grade_quote(system_size, total_price)
                     
                     # Add calculated values to analysis_data
                     analysis_data['grade'] = grade
-                    analysis_data['verdict'] = grade_info['description']
-                    analysis_data['price_per_kw'] = round(price_per_kw, 2)
-                    analysis_data['market_average'] = 2150
-                    
-                    # Calculate potential savings
-                    if price_per_kw > 2150:
-                        analysis_data['potential_savings'] = round((price_per_kw - 2150) * system_size, 2)
-                    else:
-                        analysis_data['potential_savings'] = 0
+                    analysis_data['verdict'] = grade_info.description
+                    analysis_data['price_per_kw'] = price_per_kw
+                    analysis_data['market_average'] = MARKET_AVERAGE_PER_KW
+                    analysis_data['potential_savings'] = potential_savings
             except (ValueError, TypeError, ZeroDivisionError) as e:
                 print(f"Error calculating grade: {str(e)}")
                 # Continue without grade if calculation fails
         
         # Always generate magic link token for email verification
         # This ensures users always get the magic link email, not the PDF directly
-        token = generate_magic_link_token(email, analysis_data)
+        # Taken before minting so the stored expiry never outlives the token's own
+        issued_at = int(time.time())
+        expires_at = issued_at + TOKEN_TTL_SECONDS
+        token, jti = generate_magic_link_token(email)
         
         # Store analysis data for persistence
-        analysis_storage[token] = {
+        store_analysis(jti, {
             'email': email,
             'analysis_data': analysis_data,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+            'timestamp': issued_at,
+            'exp': expires_at
+        })
         
-        # Send email
-        if send_magic_link_email(email, token):
-            return jsonify({
-                'success': True,
-                'message': 'Magic link sent successfully. Check your email!'
-            })
-        else:
-            return jsonify({'error': 'Failed to send magic link email'}), 500
+        # Send email in the background; the response doesn't wait on Resend.
+        # Queued links go out in batches, with a single send if the queue is full.
+        try:
+            ensure_background_threads()
+            _magic_link_queue.put_nowait((email, token))
+        except queue.Full:
+            future = _email_pool.submit(send_magic_link_email, email, token)
+            future.add_done_callback(_on_magic_link_email_done(email))
+        
+        return jsonify({
+            'success': True,
+            'message': 'Magic link sent successfully. Check your email!'
+        }), 202
             
     except Exception as e:
-        return jsonify({'error': f'Failed to send magic link: {str(e)}'}), 500
+        return error_response('Failed to send magic link', e)
 
 @app.route('/api/verify-token', methods=['POST'])
 def verify_token():
     """Verify the magic link token and send PDF"""
     try:
-        # Cleanup expired data periodically
-        cleanup_expired_data()
-        
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         token = data.get('token')
         
         if not token:
             return jsonify({'error': 'Token is required'}), 400
+        if not isinstance(token, str):
+            return jsonify({'error': 'Invalid token'}), 400
         
-        # First verify token without marking as used (to allow retrieval)
+        # Verify the signature first; stored state is keyed by the token's jti
         payload, error = verify_magic_link_token(token, mark_as_used=False)
         
         if error:
             return jsonify({'error': error}), 400
         
-        # Get stored analysis data
-        stored_data = analysis_storage.get(token)
+        # Fetch the stored analysis and mark the token as used in one step, eagerly,
+        # so repeat clicks don't queue a second PDF
+        jti = payload.get('jti')
+        stored_data, first_use = load_and_claim(jti) if jti else (None, False)
+        
         if not stored_data:
             return jsonify({'error': 'Analysis data not found'}), 404
         
         email = stored_data['email']
         analysis_data = stored_data['analysis_data']
         
-        # Check if PDF has already been sent for this token
-        if token not in used_tokens:
-            # First time verification - send PDF
-            if send_pdf_email(email, analysis_data):
-                # Mark token as used for PDF delivery
-                used_tokens.add(token)
-            else:
-                return jsonify({'error': 'Failed to send PDF'}), 500
+        if first_use:
+            # First time verification - send PDF in the background
+            future = _email_pool.submit(send_pdf_email, email, analysis_data)
+            future.add_done_callback(_on_pdf_email_done(jti, email))
         
         # Return success with analysis data (whether PDF was just sent or already sent)
         return jsonify({
@@ -664,7 +1443,7 @@ def verify_token():
         })
             
     except Exception as e:
-        return jsonify({'error': f'Verification failed: {str(e)}'}), 500
+        return error_response('Verification failed', e)
 
 @app.route('/api/analyse-quote', methods=['POST'])
 def analyse_quote():
@@ -678,6 +1457,8 @@ def analyse_quote():
     """
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         
         # Extract all available fields
         system_size = data.get('system_size')
@@ -696,25 +1477,9 @@ def analyse_quote():
         except (ValueError, TypeError):
             pass
         
-        # Check for INCOMPLETE verdict first
-        if not system_size or system_size <= 0 or not total_price or total_price <= 0:
-            verdict_data = VERDICT_DEFINITIONS['INCOMPLETE']
-            return jsonify({
-                'verdict_type': 'INCOMPLETE',
-                'verdict_label': verdict_data['label'],
-                'verdict_icon': verdict_data['icon'],
-                'verdict_summary': verdict_data['summary'],
-                'verdict_color': verdict_data['color'],
-                'grade': verdict_data['grade'],
-                'recommendations': [
-                    'Please provide the system size in kW (e.g., 4.0 for a 4kW system)',
-                    'Please provide the total quoted price including installation'
-                ],
-                'next_checks': [
-                    'Confirm total system size (kWp)',
-                    'Confirm total price including VAT and installation'
-                ]
-            })
+        # Check for INCOMPLETE verdict first; nan and inf count as missing
+        if not system_size or not total_price or not (0 < system_size < math.inf) or not (0 < total_price < math.inf):
+            return Response(_INCOMPLETE_BODY, mimetype='application/json')
         
         # Calculate solar kWp (system_size is already in kW)
         solar_kwp = system_size
@@ -754,294 +1519,219 @@ def analyse_quote():
             expected_total=expected_total
         )
         
-        verdict_data = VERDICT_DEFINITIONS[verdict_type]
-        
         # Generate dynamic recommendations and next checks
         recommendations = generate_recommendations(verdict_type, solar_cost_per_kwp, battery_cost_per_kwh, delta_vs_expected)
         next_checks = generate_next_checks(verdict_type, has_battery)
         
         # Calculate potential savings (for overpriced quotes)
-        if total_price > expected_total:
-            potential_savings = round(total_price - expected_total, 2)
-        else:
-            potential_savings = 0
+        potential_savings = round(max(0, total_price - expected_total), 2)
+        
+        # Rounded once; reused by the flat, legacy and nested fields below
+        solar_cost_per_kwp_rounded = round(solar_cost_per_kwp, 2)
+        
+        # Legacy fields (price_per_kw etc. for the old frontend), sent both flat and
+        # as the nested 'analysis' object; one dict serves both
+        legacy_analysis = {
+            'system_size': solar_kwp,
+            'total_price': total_price,
+            'price_per_kw': solar_cost_per_kwp_rounded,
+            'market_average': MID_MARKET_SOLAR_PER_KWP,
+            'potential_savings': potential_savings,
+            'has_battery': has_battery
+        }
         
         # Build comprehensive response
         response = {
-            # New verdict system
-            'verdict_type': verdict_type,
-            'verdict_label': verdict_data['label'],
-            'verdict_icon': verdict_data['icon'],
-            'verdict_summary': verdict_data['summary'],
-            'verdict_color': verdict_data['color'],
-            'grade': verdict_data['grade'],
+            # New verdict system (plus the legacy 'verdict' summary)
+            **VERDICT_RESPONSE_FIELDS[verdict_type],
+            **legacy_analysis,
             
             # Numeric analysis
-            'system_size': solar_kwp,
-            'total_price': total_price,
             'solar_kwp': solar_kwp,
-            'solar_cost_per_kwp': round(solar_cost_per_kwp, 2),
+            'solar_cost_per_kwp': solar_cost_per_kwp_rounded,
             'battery_kwh': battery_kwh,
             'battery_cost_per_kwh': round(battery_cost_per_kwh, 2) if battery_kwh > 0 else None,
             'expected_total': round(expected_total, 2),
             'delta_vs_expected': round(delta_vs_expected, 1),
-            'potential_savings': potential_savings,
-            'has_battery': has_battery,
             
             # Guidance
             'recommendations': recommendations,
             'next_checks': next_checks,
             
-            # Legacy compatibility (price_per_kw for old frontend)
-            'price_per_kw': round(solar_cost_per_kwp, 2),
-            'market_average': MID_MARKET_SOLAR_PER_KWP,
-            'verdict': verdict_data['summary'],
-            
             # Nested structure for backward compatibility
-            'analysis': {
-                'system_size': solar_kwp,
-                'total_price': total_price,
-                'price_per_kw': round(solar_cost_per_kwp, 2),
-                'market_average': MID_MARKET_SOLAR_PER_KWP,
-                'potential_savings': potential_savings,
-                'has_battery': has_battery
-            }
+            'analysis': legacy_analysis
         }
         
         return jsonify(response)
         
     except Exception as e:
-        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+        return error_response('Analysis failed', e)
 
 @app.route('/api/analyze-premium-quote', methods=['POST'])
 def analyze_premium_quote():
     """Analyze a premium solar quote with detailed component assessment"""
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         
         # Validate required basic fields
-        required_fields = ['system_size', 'total_price', 'user_email']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Parse basic fields
-        system_size = float(data['system_size'])
-        total_price = float(data['total_price'])
+        missing = PREMIUM_REQUIRED_FIELD_SET - data.keys()
+        if missing:
+            # Report the first missing field in declaration order, as before
+            field = next(f for f in PREMIUM_REQUIRED_FIELDS if f in missing)
+            return jsonify({'error': f'Missing required field: {field}'}), 400
+        
+        # Parse basic and premium fields; malformed numbers are a client error
+        try:
+            system_size = finite_float(data['system_size'])
+            total_price = finite_float(data['total_price'])
+            fields = parse_premium_fields(data)
+        except (TypeError, ValueError) as e:
+            return error_response('Invalid numeric field', e, 400)
         user_email = data['user_email']
         location = data.get('location', '')
         
-        # Validate basic values
+        # Validate basic values; everything below relies on system_size > 0
         if system_size <= 0:
             return jsonify({'error': 'System size must be greater than 0'}), 400
         if total_price <= 0:
             return jsonify({'error': 'Total price must be greater than 0'}), 400
         
-        # Parse premium fields - Panel details
-        panel_brand = data.get('panel_brand', '')
-        panel_model = data.get('panel_model', '')
-        panel_wattage = float(data.get('panel_wattage', 0))
-        panel_quantity = int(data.get('panel_quantity', 0))
-        
-        # Parse premium fields - Inverter details
-        inverter_brand = data.get('inverter_brand', '')
-        inverter_model = data.get('inverter_model', '')
-        inverter_type = data.get('inverter_type', '')
-        inverter_capacity = float(data.get('inverter_capacity', 0))
-        
-        # Parse premium fields - Battery details
-        has_battery = data.get('has_battery', False)
-        battery_brand = data.get('battery_brand', '')
-        battery_model = data.get('battery_model', '')
-        battery_capacity = float(data.get('battery_capacity', 0)) if has_battery else 0
-        battery_quantity = int(data.get('battery_quantity', 0)) if has_battery else 0
-        battery_warranty = int(data.get('battery_warranty', 0)) if has_battery else 0
-        
-        # Parse premium fields - Installation details
-        scaffolding_included = data.get('scaffolding_included', False)
-        scaffolding_cost = float(data.get('scaffolding_cost', 0)) if scaffolding_included else 0
-        bird_protection_included = data.get('bird_protection_included', False)
-        bird_protection_cost = float(data.get('bird_protection_cost', 0)) if bird_protection_included else 0
-        roof_type = data.get('roof_type', '')
-        roof_material = data.get('roof_material', '')
-        
-        # Parse premium fields - Installer information
-        installer_company = data.get('installer_company', '')
-        installer_location = data.get('installer_location', '')
-        installer_mcs = data.get('installer_mcs', '')
-        installer_years_in_business = int(data.get('installer_years_in_business', 0))
-        installer_warranty_years = int(data.get('installer_warranty_years', 0))
-        installation_timeline = data.get('installation_timeline', '')
-        
-        # Calculate price per kW
-        price_per_kw = total_price / system_size
-        
-        # Determine grade based on price per kW
-        grade = 'F'
-        grade_info = None
-        
-        for grade_letter, tier in SOLAR_PRICING_TIERS.items():
-            if tier['min'] <= price_per_kw <= tier['max']:
-                grade = grade_letter
-                grade_info = tier
-                break
-        
-        if grade_info is None:
-            if price_per_kw < SOLAR_PRICING_TIERS['A']['min']:
-                grade = 'A'
-                grade_info = SOLAR_PRICING_TIERS['A']
-            else:
-                grade = 'F'
-                grade_info = SOLAR_PRICING_TIERS['F']
-        
-        # Calculate potential savings
-        market_average = 2150
-        potential_savings = max(0, (price_per_kw - market_average) * system_size)
+        # Grade and potential savings from price per kW
+        grade, grade_info, price_per_kw, potential_savings = grade_quote(system_size, total_price)
         
         # Premium analysis - Component assessment
         component_analysis = {}
-        red_flags = []
-        things_to_consider = []
-        questions_to_ask = []
+        has_panels = bool(fields['panel_brand'] and fields['panel_model'])
+        has_inverter = bool(fields['inverter_brand'] and fields['inverter_model'])
+        has_mcs = bool(fields['installer_mcs'])
+        calculated_system_size = size_difference = inverter_ratio = 0
+        total_battery_capacity = recommended_min = recommended_max = scaffolding_per_kw = 0
         
         # Panel analysis
-        if panel_brand and panel_model:
+        if has_panels:
             # Calculate expected system size from panels
-            calculated_system_size = (panel_wattage * panel_quantity) / 1000
+            calculated_system_size = (fields['panel_wattage'] * fields['panel_quantity']) / 1000
             size_difference = abs(calculated_system_size - system_size)
             
             component_analysis['panels'] = {
-                'brand': panel_brand,
-                'model': panel_model,
-                'wattage': panel_wattage,
-                'quantity': panel_quantity,
+                'brand': fields['panel_brand'],
+                'model': fields['panel_model'],
+                'wattage': fields['panel_wattage'],
+                'quantity': fields['panel_quantity'],
                 'calculated_system_size': round(calculated_system_size, 2),
                 'matches_quoted_size': size_difference < 0.5
             }
-            
-            if size_difference >= 0.5:
-                red_flags.append(f'System size mismatch: {panel_quantity} x {panel_wattage}W panels = {calculated_system_size:.2f}kW, but quote states {system_size}kW')
-                questions_to_ask.append('Can you clarify the discrepancy between the number of panels and the stated system size?')
         
         # Inverter analysis
-        if inverter_brand and inverter_model:
+        if has_inverter:
             # Check inverter sizing (should be 80-110% of panel capacity)
-            inverter_ratio = (inverter_capacity / system_size) * 100 if system_size > 0 else 0
+            inverter_ratio = (fields['inverter_capacity'] / system_size) * 100
             
             component_analysis['inverter'] = {
-                'brand': inverter_brand,
-                'model': inverter_model,
-                'type': inverter_type,
-                'capacity': inverter_capacity,
+                'brand': fields['inverter_brand'],
+                'model': fields['inverter_model'],
+                'type': fields['inverter_type'],
+                'capacity': fields['inverter_capacity'],
                 'sizing_ratio': round(inverter_ratio, 1),
                 'properly_sized': 80 <= inverter_ratio <= 110
             }
-            
-            if inverter_ratio < 80:
-                red_flags.append(f'Inverter may be undersized: {inverter_capacity}kW inverter for {system_size}kW system ({inverter_ratio:.0f}% ratio)')
-                things_to_consider.append('An undersized inverter may limit system performance and energy production')
-            elif inverter_ratio > 110:
-                things_to_consider.append(f'Inverter is oversized ({inverter_ratio:.0f}% ratio), which may increase costs without significant benefit')
         
         # Battery analysis
-        if has_battery:
-            total_battery_capacity = battery_capacity * battery_quantity
+        if fields['has_battery']:
+            total_battery_capacity = fields['battery_capacity'] * fields['battery_quantity']
             # Typical recommendation: 1-2 kWh per kW of solar
             recommended_min = system_size * 1
             recommended_max = system_size * 2
             
             component_analysis['battery'] = {
-                'brand': battery_brand,
-                'model': battery_model,
-                'capacity_per_unit': battery_capacity,
-                'quantity': battery_quantity,
+                'brand': fields['battery_brand'],
+                'model': fields['battery_model'],
+                'capacity_per_unit': fields['battery_capacity'],
+                'quantity': fields['battery_quantity'],
                 'total_capacity': round(total_battery_capacity, 1),
-                'warranty_years': battery_warranty,
+                'warranty_years': fields['battery_warranty'],
                 'sizing_appropriate': recommended_min <= total_battery_capacity <= recommended_max * 1.5
             }
-            
-            if total_battery_capacity < recommended_min:
-                things_to_consider.append(f'Battery capacity ({total_battery_capacity:.1f}kWh) is below typical recommendation ({recommended_min:.1f}-{recommended_max:.1f}kWh for a {system_size}kW system)')
-                questions_to_ask.append('Have you calculated the battery size based on your actual energy consumption patterns?')
-            
-            if battery_warranty < 10:
-                things_to_consider.append(f'Battery warranty is {battery_warranty} years. Many premium batteries offer 10+ year warranties')
         
         # Installation details analysis
         installation_analysis = {}
         
-        if scaffolding_included:
-            scaffolding_per_kw = scaffolding_cost / system_size if system_size > 0 else 0
+        if fields['scaffolding_included']:
+            scaffolding_per_kw = fields['scaffolding_cost'] / system_size
             installation_analysis['scaffolding'] = {
-                'cost': scaffolding_cost,
+                'cost': fields['scaffolding_cost'],
                 'cost_per_kw': round(scaffolding_per_kw, 2)
             }
-            if scaffolding_per_kw > 150:
-                things_to_consider.append(f'Scaffolding cost (£{scaffolding_cost}) seems high at £{scaffolding_per_kw:.0f}/kW')
         
-        if bird_protection_included:
+        if fields['bird_protection_included']:
             installation_analysis['bird_protection'] = {
-                'cost': bird_protection_cost
+                'cost': fields['bird_protection_cost']
             }
-            if bird_protection_cost > 500:
-                things_to_consider.append(f'Bird protection cost (£{bird_protection_cost}) is above typical market rates (£200-400)')
         
-        if roof_type:
+        if fields['roof_type']:
             installation_analysis['roof'] = {
-                'type': roof_type,
-                'material': roof_material
+                'type': fields['roof_type'],
+                'material': fields['roof_material']
             }
         
         # Installer analysis
         installer_analysis = {
-            'company': installer_company,
-            'location': installer_location,
-            'mcs_registered': bool(installer_mcs),
-            'mcs_number': installer_mcs,
-            'years_in_business': installer_years_in_business,
-            'warranty_years': installer_warranty_years,
-            'installation_timeline': installation_timeline
+            'company': fields['installer_company'],
+            'location': fields['installer_location'],
+            'mcs_registered': has_mcs,
+            'mcs_number': fields['installer_mcs'],
+            'years_in_business': fields['installer_years_in_business'],
+            'warranty_years': fields['installer_warranty_years'],
+            'installation_timeline': fields['installation_timeline']
         }
         
-        if not installer_mcs:
-            red_flags.append('Installer does not appear to be MCS certified - this is REQUIRED for SEG payments and government incentives')
-            questions_to_ask.append('Can you provide your MCS certification number? This is essential for claiming SEG payments.')
-        
-        if installer_years_in_business < 2:
-            things_to_consider.append(f'Installer has been in business for {installer_years_in_business} year(s). Consider checking reviews and references')
-        
-        if installer_warranty_years < 5:
-            things_to_consider.append(f'Installation warranty is {installer_warranty_years} years. Industry standard is typically 5-10 years')
-            questions_to_ask.append('What does the installation warranty cover, and can it be extended?')
+        # Evaluate red flags, considerations and questions against the analysis above
+        findings = evaluate_premium_findings(dict(
+            fields,
+            system_size=system_size,
+            has_panels=has_panels,
+            calculated_system_size=calculated_system_size,
+            size_difference=size_difference,
+            has_inverter=has_inverter,
+            has_mcs=has_mcs,
+            inverter_ratio=inverter_ratio,
+            total_battery_capacity=total_battery_capacity,
+            recommended_min=recommended_min,
+            recommended_max=recommended_max,
+            scaffolding_per_kw=scaffolding_per_kw
+        ))
         
         # Build comprehensive response
         response = {
             'success': True,
             'grade': grade,
-            'verdict': grade_info['description'],
+            'verdict': grade_info.description,
             'basic_analysis': {
                 'system_size': system_size,
                 'total_price': total_price,
-                'price_per_kw': round(price_per_kw, 2),
-                'market_average': market_average,
-                'potential_savings': round(potential_savings, 2),
+                'price_per_kw': price_per_kw,
+                'market_average': MARKET_AVERAGE_PER_KW,
+                'potential_savings': potential_savings,
                 'location': location
             },
             'component_analysis': component_analysis,
             'installation_analysis': installation_analysis,
             'installer_analysis': installer_analysis,
-            'red_flags': red_flags,
-            'things_to_consider': things_to_consider,
-            'questions_to_ask': questions_to_ask,
+            'red_flags': findings['red_flags'],
+            'things_to_consider': findings['things_to_consider'],
+            'questions_to_ask': findings['questions_to_ask'],
             'user_email': user_email
         }
         
-        # Generate and send PDF report via email using Resend
+        # Generate and send PDF report via email using Resend, in the background
         try:
-            resend_api_key = os.environ.get('RESEND_API_KEY')
-            if resend_api_key:
-                email_sent = send_premium_report_email(user_email, response)
-                response['email_sent'] = email_sent
+            if RESEND_API_KEY:
+                # Hand the worker its own copy so adding email_sent below can't race it
+                future = _email_pool.submit(send_premium_report_email, user_email, dict(response))
+                future.add_done_callback(_on_premium_email_done(user_email))
+                response['email_sent'] = 'queued'
             else:
                 response['email_sent'] = False
                 response['email_error'] = 'Resend API key not configured'
@@ -1053,13 +1743,15 @@ def analyze_premium_quote():
         return jsonify(response)
         
     except Exception as e:
-        return jsonify({'error': f'Premium analysis failed: {str(e)}'}), 500
+        return error_response('Premium analysis failed', e)
 
 @app.route('/api/create-checkout-session', methods=['POST'])
 def create_checkout_session():
     """Create a Stripe checkout session for premium upgrade"""
     try:
         data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         email = data.get('email')
         
         if not email:
@@ -1068,26 +1760,12 @@ def create_checkout_session():
         # Create Stripe checkout session
         checkout_session = stripe.checkout.Session.create(
             payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'gbp',
-                    'unit_amount': 4499,  # £44.99 in pence
-                    'product_data': {
-                        'name': 'Premium Solar Quote Analysis',
-                        'description': 'Detailed analysis with panel brand assessment, inverter quality check, battery evaluation, and personalized recommendations',
-                        'images': ['https://solarverify.co.uk/logo.png'],
-                    },
-                },
-                'quantity': 1,
-            }],
+            line_items=PREMIUM_LINE_ITEMS,
             mode='payment',
-            success_url=f'{FRONTEND_URL}/premium-success?session_id={{CHECKOUT_SESSION_ID}}',
-            cancel_url=f'{FRONTEND_URL}/analyzer?upgrade=cancelled',
+            success_url=PREMIUM_SUCCESS_URL,
+            cancel_url=PREMIUM_CANCEL_URL,
             customer_email=email,
-            metadata={
-                'email': email,
-                'product': 'premium_analysis'
-            }
+            metadata={'email': email, **PREMIUM_METADATA}
         )
         
         return jsonify({
@@ -1096,13 +1774,15 @@ def create_checkout_session():
         })
         
     except Exception as e:
-        return jsonify({'error': f'Failed to create checkout session: {str(e)}'}), 500
+        return error_response('Failed to create checkout session', e)
 
 @app.route('/api/verify-payment', methods=['POST'])
 def verify_payment():
     """Verify Stripe payment and grant premium access"""
     try:
         data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         session_id = data.get('session_id')
         
         if not session_id:
@@ -1113,15 +1793,13 @@ def verify_payment():
         
         if session.payment_status == 'paid':
             email = session.customer_email or session.metadata.get('email')
+            if not email:
+                # Premium access is keyed by email, so there's nothing to record it against
+                print(f"Paid checkout session {session_id} has no customer email")
+                return jsonify({'error': 'No email address found for this payment, please contact support'}), 422
             
             # Store premium access
-            premium_payments[email] = {
-                'session_id': session_id,
-                'payment_status': 'paid',
-                'timestamp': datetime.now().isoformat(),
-                'amount': session.amount_total,
-                'currency': session.currency
-            }
+            save_premium_payment(email, session_id, 'paid', session.amount_total, session.currency)
             
             return jsonify({
                 'success': True,
@@ -1136,19 +1814,21 @@ def verify_payment():
             }), 400
             
     except Exception as e:
-        return jsonify({'error': f'Failed to verify payment: {str(e)}'}), 500
+        return error_response('Failed to verify payment', e)
 
 @app.route('/api/check-premium-access', methods=['POST'])
 def check_premium_access():
     """Check if user has premium access"""
     try:
         data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         email = data.get('email')
         
         if not email:
             return jsonify({'error': 'Email is required'}), 400
         
-        has_premium = email in premium_payments and premium_payments[email]['payment_status'] == 'paid'
+        has_premium = has_premium_access(email)
         
         return jsonify({
             'has_premium_access': has_premium,
@@ -1156,13 +1836,15 @@ def check_premium_access():
         })
         
     except Exception as e:
-        return jsonify({'error': f'Failed to check premium access: {str(e)}'}), 500
+        return error_response('Failed to check premium access', e)
 
 @app.route('/api/submit-feedback', methods=['POST'])
 def submit_feedback():
-    """Submit user feedback and store in database"""
+    """Submit user feedback and queue it for storage in the database"""
     try:
         data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         feedback_text = data.get('feedback', '')
         user_email = data.get('email', 'anonymous')
         feedback_type = data.get('type', 'general')
@@ -1170,45 +1852,28 @@ def submit_feedback():
         
         if not feedback_text:
             return jsonify({'error': 'Feedback text is required'}), 400
+        if not isinstance(feedback_text, str):
+            return jsonify({'error': 'Feedback text must be a string'}), 400
+        # Reject values the feedback table can't hold here, before they can fail a batch
+        for field, value, max_length in (('email', user_email, 255), ('type', feedback_type, 50), ('page', page, 255)):
+            if value is not None and (not isinstance(value, str) or len(value) > max_length):
+                return jsonify({'error': f'{field} must be a string of at most {max_length} characters'}), 400
+        
+        # Queue for the background writer; the response doesn't wait on the database
+        try:
+            ensure_background_threads()
+            _feedback_queue.put_nowait((feedback_text, user_email, feedback_type, page))
+        except queue.Full:
+            return jsonify({'error': 'Feedback service is busy, please try again shortly'}), 503
         
-        # Store feedback in database
-        conn = get_db_connection()
-        if conn:
-            try:
-                cur = conn.cursor()
-                cur.execute('''
-                    INSERT INTO feedback (feedback_text, user_email, feedback_type, page)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id
-                ''', (feedback_text, user_email, feedback_type, page))
-                feedback_id = cur.fetchone()['id']
-                conn.commit()
-                cur.close()
-                conn.close()
-                
-                print(f"Feedback #{feedback_id} stored: {feedback_type} from {user_email}")
-                
-                return jsonify({
-                    'success': True,
-                    'message': 'Thank you for your feedback! We appreciate you helping us improve SolarVerify.',
-                    'feedback_id': feedback_id
-                }), 200
-            except Exception as db_error:
-                print(f"Database error: {str(db_error)}")
-                conn.rollback()
-                conn.close()
-                return jsonify({'error': 'Failed to store feedback'}), 500
-        else:
-            # Fallback if database not available
-            print(f"Feedback received (no DB): {feedback_type} from {user_email}: {feedback_text}")
-            return jsonify({
-                'success': True,
-                'message': 'Thank you for your feedback!'
-            }), 200
+        return jsonify({
+            'success': True,
+            'message': 'Thank you for your feedback! We appreciate you helping us improve SolarVerify.'
+        }), 202
             
     except Exception as e:
         print(f"Error submitting feedback: {str(e)}")
-        return jsonify({'error': f'Failed to submit feedback: {str(e)}'}), 500
+        return error_response('Failed to submit feedback', e)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -15,6 +15,82 @@ import base64
 from resend_email import send_email
 
 
+# Styles are immutable once built, so they are created once at import and
+# shared by every report rather than rebuilt per PDF
+_SAMPLE_STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_SAMPLE_STYLES['Heading1'],
+    fontSize=24,
+    textColor=colors.HexColor('#0d9488'),
+    spaceAfter=30,
+    alignment=TA_CENTER,
+    fontName='Helvetica-Bold'
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_SAMPLE_STYLES['Heading2'],
+    fontSize=16,
+    textColor=colors.HexColor('#0d9488'),
+    spaceAfter=12,
+    spaceBefore=20,
+    fontName='Helvetica-Bold'
+)
+
+SUBHEADING_STYLE = ParagraphStyle(
+    'CustomSubHeading',
+    parent=_SAMPLE_STYLES['Heading3'],
+    fontSize=14,
+    textColor=colors.HexColor('#0f766e'),
+    spaceAfter=10,
+    spaceBefore=15,
+    fontName='Helvetica-Bold'
+)
+
+BODY_STYLE = ParagraphStyle(
+    'CustomBody',
+    parent=_SAMPLE_STYLES['BodyText'],
+    fontSize=11,
+    spaceAfter=10,
+    alignment=TA_JUSTIFY
+)
+
+GRADE_COLORS = {
+    'A': colors.HexColor('#10b981'),
+    'B': colors.HexColor('#3b82f6'),
+    'C': colors.HexColor('#f59e0b'),
+    'D': colors.HexColor('#ef4444'),
+    'F': colors.HexColor('#dc2626')
+}
+
+SUMMARY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e0f2f1')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 11),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ('TOPPADDING', (0, 0), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+])
+
+# Two-column label/value tables (panels, inverter, battery, installer)
+DETAIL_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+])
+
+
 def generate_premium_pdf_report(analysis_data):
     """
     Generate a comprehensive PDF report from premium analysis data
@@ -41,48 +117,6 @@ def generate_premium_pdf_report(analysis_data):
     # Container for PDF elements
     elements = []
     
-    # Define styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#0d9488'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#0d9488'),
-        spaceAfter=12,
-        spaceBefore=20,
-        fontName='Helvetica-Bold'
-    )
-    
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading3'],
-        fontSize=14,
-        textColor=colors.HexColor('#0f766e'),
-        spaceAfter=10,
-        spaceBefore=15,
-        fontName='Helvetica-Bold'
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['BodyText'],
-        fontSize=11,
-        spaceAfter=10,
-        alignment=TA_JUSTIFY
-    )
-    
     # Extract data
     grade = analysis_data.get('grade', 'N/A')
     verdict = analysis_data.get('verdict', '')
@@ -96,20 +130,14 @@ def generate_premium_pdf_report(analysis_data):
     
     # ===== COVER PAGE =====
     elements.append(Spacer(1, 1*inch))
-    elements.append(Paragraph("SolarVerify", title_style))
-    elements.append(Paragraph("Premium Solar Quote Analysis Report", heading_style))
+    elements.append(Paragraph("SolarVerify", TITLE_STYLE))
+    elements.append(Paragraph("Premium Solar Quote Analysis Report", HEADING_STYLE))
     elements.append(Spacer(1, 0.5*inch))
     
     # Grade display
-    grade_color = {
-        'A': colors.HexColor('#10b981'),
-        'B': colors.HexColor('#3b82f6'),
-        'C': colors.HexColor('#f59e0b'),
-        'D': colors.HexColor('#ef4444'),
-        'F': colors.HexColor('#dc2626')
-    }.get(grade, colors.grey)
-    
-    grade_table_data = [[Paragraph(f"<font size=48 color='white'><b>{grade}</b></font>", body_style)]]
+    grade_color = GRADE_COLORS.get(grade, colors.grey)
+    
+    grade_table_data = [[Paragraph(f"<font size=48 color='white'><b>{grade}</b></font>", BODY_STYLE)]]
     grade_table = Table(grade_table_data, colWidths=[2*inch])
     grade_table.setStyle(TableStyle([
         ('BACKGROUND', (0, 0), (-1, -1), grade_color),
@@ -123,18 +151,18 @@ def generate_premium_pdf_report(analysis_data):
     
     elements.append(grade_table)
     elements.append(Spacer(1, 0.3*inch))
-    elements.append(Paragraph(f"<b>{verdict}</b>", body_style))
+    elements.append(Paragraph(f"<b>{verdict}</b>", BODY_STYLE))
     elements.append(Spacer(1, 0.5*inch))
     
     # Report metadata
     report_date = datetime.now().strftime("%d %B %Y")
-    elements.append(Paragraph(f"<i>Report Generated: {report_date}</i>", body_style))
-    elements.append(Paragraph(f"<i>Location: {basic.get('location', 'Not specified')}</i>", body_style))
+    elements.append(Paragraph(f"<i>Report Generated: {report_date}</i>", BODY_STYLE))
+    elements.append(Paragraph(f"<i>Location: {basic.get('location', 'Not specified')}</i>", BODY_STYLE))
     
     elements.append(PageBreak())
     
     # ===== EXECUTIVE SUMMARY =====
-    elements.append(Paragraph("Executive Summary", heading_style))
+    elements.append(Paragraph("Executive Summary", HEADING_STYLE))
     
     summary_data = [
         ['System Size', f"{basic.get('system_size', 0)} kW"],
@@ -148,43 +176,32 @@ def generate_premium_pdf_report(analysis_data):
         summary_data.append(['Potential Savings', f"£{basic.get('potential_savings', 0):,.2f}"])
     
     summary_table = Table(summary_data, colWidths=[2.5*inch, 3*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e0f2f1')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('TOPPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-    ]))
+    summary_table.setStyle(SUMMARY_TABLE_STYLE)
     
     elements.append(summary_table)
     elements.append(Spacer(1, 0.3*inch))
     
     # ===== RED FLAGS =====
     if red_flags:
-        elements.append(Paragraph("⚠️ Critical Issues Identified", heading_style))
+        elements.append(Paragraph("⚠️ Critical Issues Identified", HEADING_STYLE))
         elements.append(Paragraph(
             "The following critical issues require immediate attention before proceeding with this installation:",
-            body_style
+            BODY_STYLE
         ))
         elements.append(Spacer(1, 0.1*inch))
         
         for flag in red_flags:
-            elements.append(Paragraph(f"• {flag}", body_style))
+            elements.append(Paragraph(f"• {flag}", BODY_STYLE))
         
         elements.append(Spacer(1, 0.2*inch))
     
     # ===== COMPONENT ANALYSIS =====
-    elements.append(Paragraph("Component Analysis", heading_style))
+    elements.append(Paragraph("Component Analysis", HEADING_STYLE))
     
     # Solar Panels
     if 'panels' in components:
         panels = components['panels']
-        elements.append(Paragraph("Solar Panels", subheading_style))
+        elements.append(Paragraph("Solar Panels", SUBHEADING_STYLE))
         
         panel_data = [
             ['Brand', panels.get('brand', 'N/A')],
@@ -196,16 +213,7 @@ def generate_premium_pdf_report(analysis_data):
         ]
         
         panel_table = Table(panel_data, colWidths=[2.5*inch, 3*inch])
-        panel_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
+        panel_table.setStyle(DETAIL_TABLE_STYLE)
         
         elements.append(panel_table)
         elements.append(Spacer(1, 0.2*inch))
@@ -213,7 +221,7 @@ def generate_premium_pdf_report(analysis_data):
     # Inverter
     if 'inverter' in components:
         inverter = components['inverter']
-        elements.append(Paragraph("Inverter", subheading_style))
+        elements.append(Paragraph("Inverter", SUBHEADING_STYLE))
         
         inverter_data = [
             ['Brand', inverter.get('brand', 'N/A')],
@@ -225,16 +233,7 @@ def generate_premium_pdf_report(analysis_data):
         ]
         
         inverter_table = Table(inverter_data, colWidths=[2.5*inch, 3*inch])
-        inverter_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
+        inverter_table.setStyle(DETAIL_TABLE_STYLE)
         
         elements.append(inverter_table)
         elements.append(Spacer(1, 0.2*inch))
@@ -242,7 +241,7 @@ def generate_premium_pdf_report(analysis_data):
     # Battery
     if 'battery' in components:
         battery = components['battery']
-        elements.append(Paragraph("Battery Storage", subheading_style))
+        elements.append(Paragraph("Battery Storage", SUBHEADING_STYLE))
         
         battery_data = [
             ['Brand', battery.get('brand', 'N/A')],
@@ -255,16 +254,7 @@ def generate_premium_pdf_report(analysis_data):
         ]
         
         battery_table = Table(battery_data, colWidths=[2.5*inch, 3*inch])
-        battery_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
+        battery_table.setStyle(DETAIL_TABLE_STYLE)
         
         elements.append(battery_table)
         elements.append(Spacer(1, 0.2*inch))
@@ -273,28 +263,28 @@ def generate_premium_pdf_report(analysis_data):
     
     # ===== INSTALLATION DETAILS =====
     if installation:
-        elements.append(Paragraph("Installation Details", heading_style))
+        elements.append(Paragraph("Installation Details", HEADING_STYLE))
         
         if 'scaffolding' in installation:
             scaff = installation['scaffolding']
-            elements.append(Paragraph(f"<b>Scaffolding:</b> Included (£{scaff.get('cost', 0):,.2f})", body_style))
+            elements.append(Paragraph(f"<b>Scaffolding:</b> Included (£{scaff.get('cost', 0):,.2f})", BODY_STYLE))
         
         if 'bird_protection' in installation:
             bird = installation['bird_protection']
-            elements.append(Paragraph(f"<b>Bird Protection:</b> Included (£{bird.get('cost', 0):,.2f})", body_style))
+            elements.append(Paragraph(f"<b>Bird Protection:</b> Included (£{bird.get('cost', 0):,.2f})", BODY_STYLE))
         
         if 'roof' in installation:
             roof = installation['roof']
             elements.append(Paragraph(
                 f"<b>Roof Type:</b> {roof.get('type', 'N/A').title()} | "
                 f"<b>Material:</b> {roof.get('material', 'N/A').title()}",
-                body_style
+                BODY_STYLE
             ))
         
         elements.append(Spacer(1, 0.2*inch))
     
     # ===== INSTALLER INFORMATION =====
-    elements.append(Paragraph("Installer Information", heading_style))
+    elements.append(Paragraph("Installer Information", HEADING_STYLE))
     
     installer_data = [
         ['Company Name', installer.get('company', 'N/A')],
@@ -315,64 +305,55 @@ def generate_premium_pdf_report(analysis_data):
         installer_data.append(['Timeline', installer.get('installation_timeline')])
     
     installer_table = Table(installer_data, colWidths=[2.5*inch, 3*inch])
-    installer_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-    ]))
+    installer_table.setStyle(DETAIL_TABLE_STYLE)
     
     elements.append(installer_table)
     elements.append(Spacer(1, 0.3*inch))
     
     # ===== THINGS TO CONSIDER =====
     if considerations:
-        elements.append(Paragraph("Things to Consider", heading_style))
+        elements.append(Paragraph("Things to Consider", HEADING_STYLE))
         elements.append(Paragraph(
             "The following points warrant further consideration when evaluating this quote:",
-            body_style
+            BODY_STYLE
         ))
         elements.append(Spacer(1, 0.1*inch))
         
         for consideration in considerations:
-            elements.append(Paragraph(f"• {consideration}", body_style))
+            elements.append(Paragraph(f"• {consideration}", BODY_STYLE))
         
         elements.append(Spacer(1, 0.3*inch))
     
     # ===== QUESTIONS TO ASK =====
     if questions:
-        elements.append(Paragraph("Questions to Ask Your Installer", heading_style))
+        elements.append(Paragraph("Questions to Ask Your Installer", HEADING_STYLE))
         elements.append(Paragraph(
             "We recommend asking your installer the following questions to clarify important details:",
-            body_style
+            BODY_STYLE
         ))
         elements.append(Spacer(1, 0.1*inch))
         
         for i, question in enumerate(questions, 1):
-            elements.append(Paragraph(f"{i}. {question}", body_style))
+            elements.append(Paragraph(f"{i}. {question}", BODY_STYLE))
         
         elements.append(Spacer(1, 0.3*inch))
     
     elements.append(PageBreak())
     
     # ===== DISCLAIMER =====
-    elements.append(Paragraph("Important Disclaimer", heading_style))
+    elements.append(Paragraph("Important Disclaimer", HEADING_STYLE))
     elements.append(Paragraph(
         "This report provides an independent analysis of your solar quote based on the information provided. "
         "It is intended for informational purposes only and should not be considered as professional advice. "
         "SolarVerify is not responsible for any decisions made based on this report.",
-        body_style
+        BODY_STYLE
     ))
     elements.append(Spacer(1, 0.2*inch))
     elements.append(Paragraph(
         "We strongly recommend conducting your own due diligence, obtaining multiple quotes, and consulting "
         "with qualified professionals before making any installation decisions. Always verify installer credentials, "
         "check references, and ensure all agreements are documented in writing.",
-        body_style
+        BODY_STYLE
     ))
     elements.append(Spacer(1, 0.3*inch))
     
@@ -381,7 +362,7 @@ def generate_premium_pdf_report(analysis_data):
         "<i>Report generated by SolarVerify Premium Analysis Service</i><br/>"
         "<i>For support, contact: justinburgher@solarverify.co.uk</i><br/>"
         f"<i>© {datetime.now().year} SolarVerify. All rights reserved.</i>",
-        body_style
+        BODY_STYLE
     ))
     
     # Build PDF
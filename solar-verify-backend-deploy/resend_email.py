@@ -3,12 +3,43 @@ Resend Email Helper Module for Solar Verify
 Replaces SendGrid with Resend for email sending
 """
 import os
+import uuid
 import requests
 import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 RESEND_API_KEY = os.environ.get('RESEND_API_KEY')
 RESEND_API_URL = 'https://api.resend.com/emails'
+RESEND_BATCH_URL = 'https://api.resend.com/emails/batch'
+RESEND_BATCH_MAX = 100  # Resend's per-request limit for the batch endpoint
 FROM_EMAIL = 'SolarVerify <noreply@solarverify.co.uk>'
+RESEND_TIMEOUT_SECONDS = 10
+
+if not RESEND_API_KEY:
+    print("Warning: RESEND_API_KEY not set - emails will not be sent")
+
+# One pooled session for every send, so connections to api.resend.com stay open
+# (no TLS handshake per email). Rate limits (429) and transient 5xx responses are
+# retried with exponential backoff, honouring Retry-After; each send carries an
+# Idempotency-Key so a retried POST can't deliver the same email twice.
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'POST'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+))
+# The API key is fixed for the process, so it's set on the session once
+_session.headers.update({
+    'Authorization': f'Bearer {RESEND_API_KEY}',
+    'Content-Type': 'application/json'
+})
 
 
 def send_email(to_email, subject, html_content, attachments=None):
@@ -28,10 +59,7 @@ def send_email(to_email, subject, html_content, attachments=None):
         print("Error: RESEND_API_KEY not configured")
         return False
     
-    headers = {
-        'Authorization': f'Bearer {RESEND_API_KEY}',
-        'Content-Type': 'application/json'
-    }
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
     
     payload = {
         'from': FROM_EMAIL,
@@ -44,7 +72,7 @@ def send_email(to_email, subject, html_content, attachments=None):
         payload['attachments'] = attachments
     
     try:
-        response = requests.post(RESEND_API_URL, headers=headers, json=payload)
+        response = _session.post(RESEND_API_URL, headers=headers, json=payload, timeout=RESEND_TIMEOUT_SECONDS)
         
         if response.status_code in [200, 201]:
             print(f"Email sent successfully to {to_email}")
@@ -96,3 +124,43 @@ def send_email_with_resend(to_email, subject, html_content, attachment_data, att
     }]
     
     return send_email(to_email, subject, html_content, attachments)
+
+
+def send_batch_emails(messages):
+    """
+    Send several emails in a single Resend API call
+    
+    Args:
+        messages: List of dicts with 'to_email', 'subject' and 'html_content' keys,
+            at most RESEND_BATCH_MAX long. The batch endpoint does not accept
+            attachments.
+        
+    Returns:
+        Boolean indicating success
+    """
+    if not RESEND_API_KEY:
+        print("Error: RESEND_API_KEY not configured")
+        return False
+    
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    
+    payload = [{
+        'from': FROM_EMAIL,
+        'to': [message['to_email']],
+        'subject': message['subject'],
+        'html': message['html_content']
+    } for message in messages]
+    
+    try:
+        response = _session.post(RESEND_BATCH_URL, headers=headers, json=payload, timeout=RESEND_TIMEOUT_SECONDS)
+        
+        if response.status_code in [200, 201]:
+            print(f"Batch of {len(messages)} emails sent successfully")
+            return True
+        else:
+            print(f"Error sending batch: {response.status_code} - {response.text}")
+            return False
+            
+    except Exception as e:
+        print(f"Exception sending batch: {str(e)}")
+        return False
@@ -0,0 +1,37 @@
+import os
+import threading
+
+import main
+
+
+def _thread_names():
+    return {thread.name for thread in threading.enumerate() if thread.is_alive()}
+
+
+def test_reinit_after_fork_gives_fresh_locks_queues_and_threads():
+    old = {name: getattr(main, name) for name in (
+        '_db_pool_lock', '_storage_lock', '_token_payload_lock', '_background_lock',
+        '_feedback_queue', '_magic_link_queue', '_email_pool')}
+    # Simulate a fork landing while the parent's cleanup thread holds the storage lock
+    main._storage_lock.acquire()
+    try:
+        main._reinit_after_fork()
+    finally:
+        old['_storage_lock'].release()
+
+    for name, value in old.items():
+        assert getattr(main, name) is not value, name
+    assert main._storage_lock.acquire(blocking=False)
+    main._storage_lock.release()
+
+    assert main._background_pid == os.getpid()
+    assert {'feedback-writer', 'magic-link-sender'} <= _thread_names()
+    if main.redis_client is None:
+        assert 'token-cleanup' in _thread_names()
+
+
+def test_background_threads_start_once_per_process():
+    main.ensure_background_threads()
+    before = threading.active_count()
+    main.ensure_background_threads()
+    assert threading.active_count() == before
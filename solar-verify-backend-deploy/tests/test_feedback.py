@@ -0,0 +1,75 @@
+import queue
+
+import main
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            self.execute(sql, row)
+
+    def execute(self, sql, row):
+        if len(row[2]) > 50:
+            raise ValueError('value too long for type character varying(50)')
+        self.conn.pending.append(row)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.pending = []
+        self.committed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+def test_submit_feedback_rejects_bad_fields(client):
+    bad_bodies = [
+        ['not', 'an', 'object'],
+        {'feedback': {'text': 'hi'}},
+        {'feedback': 'hi', 'type': 'x' * 51},
+        {'feedback': 'hi', 'page': 'x' * 256},
+        {'feedback': 'hi', 'email': ['a@example.com']},
+    ]
+    for body in bad_bodies:
+        assert client.post('/api/submit-feedback', json=body).status_code == 400
+
+
+def test_failed_batch_is_retried_row_by_row(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(main, 'get_db_connection', lambda: conn)
+    monkeypatch.setattr(main, 'release_db_connection', lambda c: None)
+    rows = [('good', 'a@example.com', 'general', 'home'),
+            ('bad', 'b@example.com', 'x' * 51, 'home'),
+            ('also good', 'c@example.com', 'bug', 'analyzer')]
+
+    main.write_feedback_batch(rows)
+
+    assert conn.committed == [rows[0], rows[2]]
+
+
+def test_flush_feedback_queue_writes_queued_rows(monkeypatch):
+    written = []
+    monkeypatch.setattr(main, '_feedback_queue', queue.Queue())
+    monkeypatch.setattr(main, 'write_feedback_batch', written.extend)
+    main._feedback_queue.put(('hi', 'a@example.com', 'general', 'home'))
+
+    main.flush_feedback_queue()
+
+    assert written == [('hi', 'a@example.com', 'general', 'home')]
+    assert main._feedback_queue.empty()
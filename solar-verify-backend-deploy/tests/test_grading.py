@@ -0,0 +1,63 @@
+import pytest
+
+import main
+
+PREMIUM_QUOTE = {'system_size': 4, 'total_price': 6000, 'user_email': 'a@example.com'}
+
+
+@pytest.mark.parametrize('field', ['system_size', 'total_price'])
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', 'NaN', 'Infinity'])
+def test_premium_quote_rejects_non_finite_numbers(client, field, value):
+    response = client.post('/api/analyze-premium-quote', json=dict(PREMIUM_QUOTE, **{field: value}))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf'])
+def test_premium_quote_rejects_non_finite_component_fields(client, value):
+    response = client.post('/api/analyze-premium-quote', json=dict(PREMIUM_QUOTE, panel_wattage=value))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf'])
+def test_analyse_quote_treats_non_finite_numbers_as_incomplete(client, value):
+    response = client.post('/api/analyse-quote', json={'system_size': value, 'total_price': 6000})
+    assert response.get_json()['verdict_type'] == 'INCOMPLETE'
+
+
+def test_determine_grade_rejects_nan():
+    with pytest.raises(ValueError):
+        main.determine_grade(float('nan'))
+
+
+def test_determine_grade_clamps_to_outer_tiers():
+    assert main.determine_grade(100)[0] == 'A'
+    assert main.determine_grade(float('inf'))[0] == 'F'
+
+
+@pytest.mark.parametrize('path', ['/api/analyse-quote', '/api/analyze-premium-quote',
+                                  '/api/send-magic-link', '/api/verify-token',
+                                  '/api/create-checkout-session', '/api/verify-payment',
+                                  '/api/check-premium-access', '/api/submit-feedback'])
+@pytest.mark.parametrize('body', [['system_size', 4], 'quote', 42])
+def test_non_object_json_bodies_are_rejected(client, path, body):
+    assert client.post(path, json=body).status_code == 400
+
+
+@pytest.mark.parametrize('analysis_data', [[1], 'quote', 42])
+def test_send_magic_link_rejects_non_object_analysis_data(client, analysis_data):
+    response = client.post('/api/send-magic-link', json={'email': 'a@example.com', 'analysis_data': analysis_data})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '£inf', '-Infinity'])
+def test_send_magic_link_rejects_non_finite_money_fields(client, value):
+    for analysis_data in ({'system_size': 4, 'total_price': value},
+                          {'analysis': {'system_size': 4, 'total_price': value}}):
+        response = client.post('/api/send-magic-link', json={'email': 'a@example.com', 'analysis_data': analysis_data})
+        assert response.status_code == 400
+
+
+def test_normalize_money_fields_still_parses_display_strings():
+    analysis_data = {'total_price': '£12,345', 'system_size': 'unknown'}
+    main.normalize_money_fields(analysis_data)
+    assert analysis_data == {'total_price': 12345.0, 'system_size': 'unknown'}
@@ -0,0 +1,28 @@
+import main
+
+
+def test_send_magic_link_rejects_malformed_email(client):
+    for email in ('not-an-email', 'a@b', 'a b@c.com', ['a@b.com'], 'a@b.com' + 'x' * 300):
+        response = client.post('/api/send-magic-link', json={'email': email})
+        assert response.status_code == 400
+
+
+def test_failed_batch_falls_back_to_individual_sends(monkeypatch):
+    sent = []
+    monkeypatch.setattr(main, 'send_batch_emails', lambda messages: False)
+    monkeypatch.setattr(main, 'send_email', lambda to, subject, html: sent.append(to) or to != 'bad@example.com')
+
+    main.send_magic_link_batch([('a@example.com', 't1'), ('bad@example.com', 't2'), ('b@example.com', 't3')])
+
+    assert sent == ['a@example.com', 'bad@example.com', 'b@example.com']
+
+
+def test_verify_token_rejects_non_string_tokens(client):
+    for token in (123, ['a.b.c'], {'jti': 'x'}, True):
+        response = client.post('/api/verify-token', json={'token': token})
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'Invalid token'}
+
+
+def test_verify_magic_link_token_rejects_non_string_tokens():
+    assert main.verify_magic_link_token(123) == (None, 'Invalid token')
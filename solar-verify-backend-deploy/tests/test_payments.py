@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import main
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params):
+        if params[0] is None:
+            raise ValueError('null value in column "email" violates not-null constraint')
+        self.conn.executed.append(params)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def _paid_session(customer_email=None, metadata=None):
+    return SimpleNamespace(payment_status='paid', customer_email=customer_email,
+                           metadata=metadata or {}, amount_total=2999, currency='gbp')
+
+
+def _use_fakes(monkeypatch, session):
+    conn = FakeConnection()
+    monkeypatch.setattr(main, 'get_db_connection', lambda: conn)
+    monkeypatch.setattr(main, 'release_db_connection', lambda c: None)
+    monkeypatch.setattr(main.stripe.checkout.Session, 'retrieve', lambda session_id: session)
+    return conn
+
+
+def test_verify_payment_without_email_is_rejected_before_saving(client, monkeypatch):
+    conn = _use_fakes(monkeypatch, _paid_session())
+
+    response = client.post('/api/verify-payment', json={'session_id': 'cs_test_123'})
+
+    assert response.status_code == 422
+    assert conn.executed == []
+
+
+def test_verify_payment_saves_metadata_email(client, monkeypatch):
+    conn = _use_fakes(monkeypatch, _paid_session(metadata={'email': 'a@example.com'}))
+
+    response = client.post('/api/verify-payment', json={'session_id': 'cs_test_123'})
+
+    assert response.status_code == 200
+    assert conn.executed == [('a@example.com', 'cs_test_123', 'paid', 2999, 'gbp')]
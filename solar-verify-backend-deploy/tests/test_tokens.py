@@ -0,0 +1,57 @@
+import base64
+import time
+
+import jwt
+import orjson
+import pytest
+
+import main
+
+
+def _segment(obj):
+    return base64.urlsafe_b64encode(orjson.dumps(obj)).rstrip(b'=').decode()
+
+
+def _sign(header, payload):
+    """Build a token with an arbitrary header, correctly signed with our secret"""
+    signing_input = f'{_segment(header)}.{_segment(payload)}'
+    signature = jwt.algorithms.HMACAlgorithm(jwt.algorithms.HMACAlgorithm.SHA256).sign(
+        signing_input.encode(), main.JWT_SECRET_BYTES)
+    return f'{signing_input}.{base64.urlsafe_b64encode(signature).rstrip(b"=").decode()}'
+
+
+def test_fast_path_accepts_our_tokens():
+    token, jti = main.generate_magic_link_token('a@example.com')
+
+    payload = main.decode_token_fast(token)
+
+    assert payload == jwt.decode(token, main.JWT_SECRET, algorithms=['HS256'])
+    assert payload['jti'] == jti
+
+
+def test_fast_path_rejects_tampered_payload():
+    token, _ = main.generate_magic_link_token('a@example.com')
+    header, _, signature = token.split('.')
+    forged = f"{header}.{_segment({'email': 'b@example.com', 'exp': int(time.time()) + 60, 'jti': 'x'})}.{signature}"
+
+    assert main.decode_token_fast(forged) is None
+    assert main.verify_magic_link_token(forged, mark_as_used=False) == (None, 'Invalid token')
+
+
+@pytest.mark.parametrize('header', [
+    {'alg': 'HS256', 'typ': 'JWT', 'kid': 'other'},
+    {'alg': 'HS256', 'typ': 'JWT', 'crit': ['exp']},
+    {'alg': 'HS256'},
+])
+def test_fast_path_defers_foreign_headers_to_pyjwt(header):
+    token = _sign(header, {'email': 'a@example.com', 'exp': int(time.time()) + 60, 'jti': 'x'})
+
+    assert main.decode_token_fast(token) is None
+
+
+def test_fast_path_rejects_expired_tokens():
+    token = jwt.encode({'email': 'a@example.com', 'exp': int(time.time()) - 1, 'jti': 'x'},
+                       main.JWT_SECRET, algorithm='HS256')
+
+    assert main.decode_token_fast(token) is None
+    assert main.verify_magic_link_token(token, mark_as_used=False) == (None, 'Token has expired')